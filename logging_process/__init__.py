@@ -1 +1,6 @@
 from .clog import MyRotatingFileHandler, MyTimedRotatingFileHandler
+from .clog import MyBufferedRotatingFileHandler, MyBufferedTimedRotatingFileHandler
+from .writer import start_log_writer, LogWriter, QueueProducerHandler
+from .background import BackgroundHandler
+from .formatter import FastFormatter, JsonFormatter
+from .filters import BurstFilter
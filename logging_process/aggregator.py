@@ -0,0 +1,286 @@
+"""
+Local log aggregator listening on a Unix domain socket.
+
+Processes that are not children of one parent cannot share a queue, so they
+send their formatted records to this daemon instead, which is then the only
+process writing the log files through the rotating handlers of this package.
+本地日志汇聚进程：多个独立进程通过Unix socket把日志发给它，由它一个进程顺序写文件。
+
+    python -m logging_process.aggregator --socket /run/example-log.sock --config handlers.json
+
+handlers.json maps a target name to a dictConfig-style handler dict::
+
+    {"access": {"class": "logging_process.MyTimedRotatingFileHandler",
+                "filename": "/data/log/example/access.log", "when": "d", "backupCount": 60}}
+
+Clients use logging_process.aggregator.AggregatorClientHandler (or BufferedAggregatorClientHandler to
+send records in batches). Every message on the socket is a frame: an 8 byte
+header (body length, target length, highest level of the records), the
+UTF-8 target name and the UTF-8 body, which is one or more records joined
+with the terminator.
+"""
+import argparse
+import json
+import logging
+import os
+import selectors
+import signal
+import socket
+import struct
+import time
+
+from .clog import ConcurrentBuffer
+from .writer import build_handler, write_batch
+
+HEADER = struct.Struct("!IHH")
+
+
+def encode_frame(target, body, levelno=None):
+    target = target.encode("utf-8")
+    body = body.encode("utf-8", "replace")
+    return HEADER.pack(len(body), len(target), min(max(levelno or 0, 0), 0xffff)) + target + body
+
+
+class LogAggregator(object):
+    """
+    The daemon: accepts any number of client connections and, after every
+    select() round, writes all complete frames per target in one locked write.
+    """
+    def __init__(self, address, handlers, recvSize=256 * 1024):
+        self.address = address
+        self.handlers = dict((name, build_handler(spec, keepOpen=True)) for name, spec in handlers.items())
+        self.recvSize = recvSize
+        self.selector = selectors.DefaultSelector()
+        self.sock = None
+        self._buffers = {}
+        self._running = False
+
+    def _bind(self):
+        if os.path.exists(self.address):
+            probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                probe.connect(self.address)
+            except (IOError, OSError):
+                os.remove(self.address)  # stale socket of a dead daemon
+            else:
+                probe.close()
+                raise RuntimeError("an aggregator is already listening on %s" % self.address)
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.bind(self.address)
+        self.sock.listen(128)
+        self.sock.setblocking(False)
+        self.selector.register(self.sock, selectors.EVENT_READ)
+
+    def _accept(self):
+        try:
+            conn, _ = self.sock.accept()
+        except (IOError, OSError):
+            return
+        conn.setblocking(False)
+        self._buffers[conn] = bytearray()
+        self.selector.register(conn, selectors.EVENT_READ)
+
+    def _drop(self, conn):
+        self.selector.unregister(conn)
+        self._buffers.pop(conn, None)
+        conn.close()
+
+    def _read(self, conn, batch):
+        try:
+            data = conn.recv(self.recvSize)
+        except (BlockingIOError, InterruptedError):
+            return False
+        except (IOError, OSError):
+            data = b""
+        if not data:
+            # An incomplete frame left in the buffer is discarded with the connection.
+            self._drop(conn)
+            return False
+        buf = self._buffers[conn]
+        buf += data
+        offset = 0
+        while len(buf) - offset >= HEADER.size:
+            body_len, target_len, levelno = HEADER.unpack_from(buf, offset)
+            end = offset + HEADER.size + target_len + body_len
+            if len(buf) < end:
+                break
+            start = offset + HEADER.size
+            target = bytes(buf[start:start + target_len]).decode("utf-8", "replace")
+            body = bytes(buf[start + target_len:end]).decode("utf-8", "replace")
+            entry = batch.setdefault(target, [levelno, []])
+            entry[0] = max(entry[0], levelno)
+            entry[1].append(body)
+            offset = end
+        del buf[:offset]
+        return True
+
+    def serve_forever(self, pollInterval=1.0):
+        self._bind()
+        self._running = True
+        try:
+            while self._running:
+                batch = {}
+                for key, _ in self.selector.select(pollInterval):
+                    if key.fileobj is self.sock:
+                        self._accept()
+                    else:
+                        self._read(key.fileobj, batch)
+                self._write(batch)
+            # whatever the clients sent before we stopped is still written
+            batch = {}
+            for conn in list(self._buffers):
+                while conn in self._buffers and self._read(conn, batch):
+                    pass
+            self._write(batch)
+        finally:
+            self.close()
+
+    def _write(self, batch):
+        for target, (levelno, bodies) in batch.items():
+            handler = self.handlers.get(target)
+            if handler is not None:
+                write_batch(handler, bodies, levelno)
+
+    def stop(self):
+        self._running = False
+
+    def close(self):
+        for conn in list(self._buffers):
+            self._drop(conn)
+        if self.sock is not None:
+            self.selector.unregister(self.sock)
+            self.sock.close()
+            self.sock = None
+            try:
+                os.remove(self.address)
+            except (IOError, OSError):
+                pass
+        for handler in self.handlers.values():
+            handler.close()
+
+
+class AggregatorClientHandler(logging.Handler):
+    """
+    Send formatted records to the aggregator over one persistent connection.
+
+    When the daemon cannot be reached or a send fails the connection is
+    retried with exponential backoff (backoff doubling up to maxBackoff
+    seconds, back to backoff once a connection carried records), and in
+    the meantime records are written through fallback, a dictConfig-style
+    handler dict for the same file, i.e. the normal locked path. Without a
+    fallback they are dropped and counted in ``dropped``.
+    """
+    def __init__(self, address, target, fallback=None, timeout=1.0, backoff=0.5, maxBackoff=30.0):
+        logging.Handler.__init__(self)
+        self.address = address
+        self.target = target
+        self.fallback = fallback
+        self.timeout = timeout
+        self.backoff = backoff
+        self.maxBackoff = maxBackoff
+        self.terminator = "\n"
+        self.dropped = 0
+        self.sock = None
+        self._sock_pid = None
+        self._retry_at = 0
+        self._next_backoff = backoff
+        self._sent = 0
+        self._fallback_handler = None
+
+    def _connect(self):
+        now = time.time()
+        if now < self._retry_at:
+            return None
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        try:
+            sock.connect(self.address)
+        except (IOError, OSError):
+            sock.close()
+            self._retry_at = now + self._next_backoff
+            self._next_backoff = min(self._next_backoff * 2, self.maxBackoff)
+            return None
+        self.sock = sock
+        self._sock_pid = os.getpid()
+        self._sent = 0
+        return sock
+
+    def _close_socket(self):
+        if self.sock is not None:
+            self.sock.close()
+            self.sock = None
+
+    def _write_record(self, msg, levelno=None, count=1):
+        sock = self.sock
+        if sock is None or self._sock_pid != os.getpid():
+            # a connection inherited across fork() would interleave frames with the parent's
+            self._close_socket()
+            sock = self._connect()
+        if sock is not None:
+            try:
+                sock.sendall(encode_frame(self.target, msg, levelno))
+                self._sent += 1
+                if self._sent == 2:
+                    # the first frame may only reach the socket buffer of a peer about to fail
+                    self._next_backoff = self.backoff
+                return
+            except (IOError, OSError):
+                self._close_socket()
+                self._retry_at = time.time() + self._next_backoff
+                self._next_backoff = min(self._next_backoff * 2, self.maxBackoff)
+        if self.fallback is None:
+            self.dropped += count
+            return
+        if self._fallback_handler is None:
+            self._fallback_handler = build_handler(self.fallback)
+        write_batch(self._fallback_handler, [msg], levelno)
+
+    def emit(self, record):
+        # noinspection PyBroadException
+        try:
+            msg = self.format(record)
+            self._write_record(msg, record.levelno)
+        except (KeyboardInterrupt, SystemExit):
+            raise
+        except Exception:
+            self.handleError(record)
+
+    def close(self):
+        self.acquire()
+        try:
+            self._close_socket()
+            if self._fallback_handler is not None:
+                self._fallback_handler.close()
+                self._fallback_handler = None
+        finally:
+            self.release()
+        logging.Handler.close(self)
+
+
+class BufferedAggregatorClientHandler(ConcurrentBuffer, AggregatorClientHandler):
+    """
+    AggregatorClientHandler that sends records in batches, see ConcurrentBuffer.
+    """
+    def __init__(self, address, target, fallback=None, timeout=1.0, backoff=0.5, maxBackoff=30.0,
+                 flushCount=100, flushBytes=64 * 1024, flushInterval=1.0, flushLevel=logging.ERROR):
+        AggregatorClientHandler.__init__(self, address, target, fallback, timeout, backoff, maxBackoff)
+        self._init_buffer(flushCount, flushBytes, flushInterval, flushLevel)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="logging_process aggregator daemon")
+    parser.add_argument("--socket", required=True, help="path of the Unix domain socket to listen on")
+    parser.add_argument("--config", required=True, help="JSON file mapping target names to handler dicts")
+    args = parser.parse_args(argv)
+    with open(args.config) as f:
+        handlers = json.load(f)
+    aggregator = LogAggregator(args.socket, handlers)
+    signal.signal(signal.SIGTERM, lambda signum, frame: aggregator.stop())
+    try:
+        aggregator.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,191 @@
+"""
+Non-blocking wrapper: records are formatted in the calling thread and handed
+to a background thread through a bounded queue, so a slow disk or a long
+rollover never blocks the caller (e.g. an asyncio event loop thread).
+后台线程写日志：调用线程只负责格式化并放入有界队列，写文件和切分都在后台线程完成。
+"""
+import logging
+import os
+import tempfile
+import threading
+import weakref
+
+from .writer import build_handler, write_batch
+
+try:
+    from queue import Queue, Empty, Full
+except ImportError:  # pragma: no cover
+    from Queue import Queue, Empty, Full
+
+_STOP = None
+
+OVERFLOW_POLICIES = ('block', 'drop_newest', 'drop_below_level', 'spill')
+
+_handlers = weakref.WeakSet()
+
+
+def _before_fork():
+    # Drain the queues so that neither process is left with the other's records.
+    for handler in list(_handlers):
+        handler.flush()
+
+
+def _after_fork_in_child():
+    for handler in list(_handlers):
+        handler._reinit()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(before=_before_fork, after_in_child=_after_fork_in_child)
+
+
+class BackgroundHandler(logging.Handler):
+    """
+    Wrap one of the rotating handlers of this package (or a dictConfig-style
+    dict describing one) and write its records from a background thread.
+
+    When the queue of maxsize records is full the overflow policy decides:
+
+    * ``block``: wait for room, as the wrapped handler would have;
+    * ``drop_newest``: drop the record, counted in ``dropped``;
+    * ``drop_below_level``: drop records below dropLevel, wait for the rest;
+    * ``spill``: append the record to a temporary file in spillDir, counted in
+      ``spilled``, which the background thread writes out once the queue is
+      empty again. Spilled records may end up after newer queued ones.
+
+    The queue is drained on flush(), close() (and so at exit through
+    logging.shutdown()) and before fork().
+    """
+    def __init__(self, handler, maxsize=10000, overflow='block', dropLevel=logging.WARNING, spillDir=None,
+                 batchSize=500):
+        logging.Handler.__init__(self)
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError("overflow must be one of %s" % (OVERFLOW_POLICIES,))
+        if isinstance(handler, dict):
+            handler = build_handler(handler)
+        if isinstance(dropLevel, str):
+            dropLevel = logging.getLevelName(dropLevel)
+        self.target = handler
+        self.maxsize = maxsize
+        self.overflow = overflow
+        self.dropLevel = dropLevel
+        self.spillDir = spillDir
+        self.batchSize = batchSize
+        self.dropped = 0
+        self.spilled = 0
+        self._reinit()
+        _handlers.add(self)
+
+    def _reinit(self):
+        self._queue = Queue(self.maxsize)
+        self._thread = None
+        self._spill = None
+        self._spill_level = logging.NOTSET
+        self._spill_pending = False
+        self._spill_lock = threading.Lock()
+
+    def _start(self):
+        self._thread = threading.Thread(target=self._run, name="logging_process-background")
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _run(self):
+        q = self._queue
+        stopping = False
+        while not stopping:
+            item = q.get()
+            items = [item]
+            while len(items) < self.batchSize:
+                try:
+                    items.append(q.get_nowait())
+                except Empty:
+                    break
+            records = [i for i in items if i is not _STOP]
+            stopping = len(records) < len(items)
+            if records:
+                write_batch(self.target, [msg for _, msg in records], max(levelno for levelno, _ in records))
+            for _ in items:
+                q.task_done()
+            if self._spill_pending and q.empty():
+                self._write_spill()
+
+    def _write_spill(self):
+        with self._spill_lock:
+            spill = self._spill
+            levelno = self._spill_level
+            self._spill_pending = False
+            self._spill_level = logging.NOTSET
+            if spill is None:
+                return
+            spill.seek(0)
+            while True:
+                lines = spill.readlines(1 << 20)
+                if not lines:
+                    break
+                write_batch(self.target, ["".join(lines)[:-len(self.target.terminator)]], levelno)
+            spill.seek(0)
+            spill.truncate()
+
+    def _spill_record(self, msg, levelno):
+        with self._spill_lock:
+            if self._spill is None:
+                self._spill = tempfile.TemporaryFile("w+", dir=self.spillDir,
+                                                     encoding=getattr(self.target, 'encoding', None) or 'utf-8',
+                                                     prefix="logging_process-spill-")
+            self._spill.write(msg + self.target.terminator)
+            self._spill_level = max(self._spill_level, levelno)
+            self._spill_pending = True
+            self.spilled += 1
+
+    def _put(self, msg, levelno):
+        try:
+            self._queue.put_nowait((levelno, msg))
+            return
+        except Full:
+            pass
+        policy = self.overflow
+        if policy == 'block' or (policy == 'drop_below_level' and levelno >= self.dropLevel):
+            self._queue.put((levelno, msg))
+        elif policy == 'spill':
+            self._spill_record(msg, levelno)
+        else:
+            self.dropped += 1
+
+    def emit(self, record):
+        # noinspection PyBroadException
+        try:
+            if record.levelno < self.target.level:
+                return
+            msg = self.target.format(record)
+            if self._thread is None:
+                self._start()
+            self._put(msg, record.levelno)
+        except (KeyboardInterrupt, SystemExit):
+            raise
+        except Exception:
+            self.handleError(record)
+
+    def flush(self):
+        """Wait until everything queued (and spilled) has been written."""
+        if self._thread is not None and self._thread.is_alive():
+            self._queue.join()
+        if self._spill_pending:
+            self._write_spill()
+
+    def close(self):
+        self.acquire()
+        try:
+            if self._thread is not None and self._thread.is_alive():
+                self._queue.put(_STOP)
+                self._thread.join()
+            self._thread = None
+            if self._spill_pending:
+                self._write_spill()
+            if self._spill is not None:
+                self._spill.close()
+                self._spill = None
+            self.target.close()
+        finally:
+            self.release()
+        _handlers.discard(self)
+        logging.Handler.close(self)
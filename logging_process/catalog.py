@@ -0,0 +1,228 @@
+"""
+Catalog of the backups of one log file, shared by every process logging to
+it, so that retention never has to list the directory.
+备份文件目录：记录本handler的每个备份（名字、大小、时间），切分时据此决定删除哪些文件，无需遍历目录。
+
+The catalog is the hidden file .__access.backups next to the lock file. It
+starts with a fixed-width header line holding its generation, followed by a
+log of one line per change, appended with a single write while holding the
+file lock:
+
+    # backups <generation>      header, generation as 20 digits
+    + <mtime> <size> <name>     a backup was rotated
+    z <size> <ext> <name>       it was compressed to <name><ext>
+    - <name>                    it was deleted
+
+Names are relative to the directory of the log file and never carry the
+compression extension. Every process keeps the entries in memory and only
+reads the lines appended since it last looked, so a rollover costs O(1)
+amortized. Once deleted entries make up most of the file (and on every
+rollover of the classic .1 ... .N scheme, which renames them all) it is
+rewritten with the live ones and the next generation; a process that finds
+another generation than the one it read reads the whole file again. Inode
+numbers cannot tell rewrites apart since file systems hand them out again
+in turn. A missing or unreadable catalog is rebuilt from a single directory
+scan.
+"""
+import os
+import time
+from collections import OrderedDict
+from secrets import randbits
+
+from .compress import strip_compressed_extension
+
+COMPACT_MIN_LINES = 64
+
+HEADER_FORMAT = "# backups %020d\n"
+HEADER_SIZE = len(HEADER_FORMAT % 0)
+
+
+def _generation(header):
+    """The generation in the header line of a catalog, None if it has none."""
+    if len(header) != HEADER_SIZE or not header.startswith(b"# backups ") or header[-1:] != b"\n":
+        return None
+    try:
+        return int(header[10:-1])
+    except ValueError:
+        return None
+
+
+class BackupCatalog(object):
+    """
+    The backups of one log file, oldest first, as name -> [mtime, size, ext].
+    scan() returns the paths of the existing backups, oldest first, to
+    rebuild it. Every method must be called with the file lock held, after
+    load().
+    """
+    def __init__(self, filename, scan):
+        self.filename = filename
+        self.dirName = os.path.dirname(filename)
+        self.scan = scan
+        self.entries = OrderedDict()
+        self.totalBytes = 0
+        self._generation = None
+        self._offset = 0
+        self._lines = 0
+
+    def __contains__(self, path):
+        return self.name(path) in self.entries
+
+    def __len__(self):
+        return len(self.entries)
+
+    def name(self, path):
+        return os.path.relpath(strip_compressed_extension(path), self.dirName)
+
+    def path(self, name):
+        """The current file of the backup name, compressed or not."""
+        return os.path.join(self.dirName, name + self.entries[name][2])
+
+    def load(self):
+        """Catch up with the lines appended by other processes since the last call."""
+        try:
+            f = open(self.filename, "rb")
+        except (IOError, OSError):
+            self.rebuild()
+            return
+        with f:
+            generation = _generation(f.read(HEADER_SIZE))
+            if generation is not None:
+                size = os.fstat(f.fileno()).st_size
+                if generation != self._generation or size < self._offset:
+                    # rewritten by another process
+                    self._clear()
+                    self._generation = generation
+                    self._offset = HEADER_SIZE
+                if size == self._offset:
+                    return
+                f.seek(self._offset)
+                data = f.read()
+        if generation is None:
+            # not a catalog (e.g. the "first next" line of the sequence backups index) or one without generation
+            self.rebuild()
+            return
+        end = data.rfind(b"\n") + 1
+        try:
+            for line in data[:end].decode("utf-8").splitlines():
+                self._apply(line)
+        except (ValueError, KeyError, IndexError):
+            # damaged
+            self.rebuild()
+            return
+        self._offset += end
+
+    def _clear(self):
+        self.entries = OrderedDict()
+        self.totalBytes = 0
+        self._offset = 0
+        self._lines = 0
+
+    def _apply(self, line):
+        op, rest = line[:2], line[2:]
+        if op == "+ ":
+            mtime, size, name = rest.split(" ", 2)
+            if name in self.entries:
+                self.totalBytes -= self.entries.pop(name)[1]
+            self.entries[name] = [float(mtime), int(size), ""]
+            self.totalBytes += int(size)
+        elif op == "z ":
+            size, ext, name = rest.split(" ", 2)
+            entry = self.entries[name]
+            self.totalBytes += int(size) - entry[1]
+            entry[1] = int(size)
+            entry[2] = ext
+        elif op == "- ":
+            self.totalBytes -= self.entries.pop(rest)[1]
+        else:
+            raise ValueError("bad catalog line %r" % line)
+        self._lines += 1
+
+    def _append(self, line):
+        data = (line + "\n").encode("utf-8")
+        try:
+            fd = os.open(self.filename, os.O_WRONLY | os.O_APPEND)
+        except (IOError, OSError):
+            # removed since load(): write it anew, header included
+            self._apply(line)
+            self.rewrite()
+            return
+        try:
+            os.write(fd, data)
+        finally:
+            os.close(fd)
+        self._apply(line)
+        self._offset += len(data)
+
+    def add(self, path, mtime, size):
+        self._append("+ %.3f %d %s" % (mtime, size, self.name(path)))
+
+    def compressed(self, path, ext, size):
+        name = self.name(path)
+        if name in self.entries:
+            self._append("z %d %s %s" % (size, ext, name))
+
+    def remove(self, name):
+        if name in self.entries:
+            self._append("- %s" % name)
+            if self._lines > COMPACT_MIN_LINES and self._lines > 2 * len(self.entries):
+                self.rewrite()
+
+    def expired(self, backupCount=0, maxTotalBytes=None, maxAgeDays=None, now=None, count=0, size=0):
+        """
+        The names of the oldest backups to delete, oldest first, so that at
+        most backupCount backups (0 for no limit) of at most maxTotalBytes
+        bytes in total remain and none is older than maxAgeDays. count and
+        size are those of backups about to be added.
+        """
+        count += len(self.entries)
+        total = self.totalBytes + size
+        cutoff = None
+        if maxAgeDays is not None:
+            cutoff = (now if now is not None else time.time()) - maxAgeDays * 86400
+        result = []
+        for name, (mtime, entrySize, _) in self.entries.items():
+            if not ((backupCount and count > backupCount) or (maxTotalBytes and total > maxTotalBytes)
+                    or (cutoff is not None and mtime < cutoff)):
+                break
+            result.append(name)
+            count -= 1
+            total -= entrySize
+        return result
+
+    def replace(self, entries):
+        """Replace every entry with entries, (path, mtime, size, ext) oldest first, and rewrite the file."""
+        self._clear()
+        for path, mtime, size, ext in entries:
+            self.entries[self.name(path)] = [mtime, size, ext]
+            self.totalBytes += size
+        self.rewrite()
+
+    def rebuild(self):
+        """Rebuild the catalog from scan(), stat()ing every backup."""
+        entries = []
+        for path in self.scan():
+            try:
+                st = os.stat(path)
+            except (IOError, OSError):
+                continue
+            base = strip_compressed_extension(path)
+            entries.append((base, st.st_mtime, st.st_size, path[len(base):]))
+        self.replace(entries)
+
+    def rewrite(self):
+        """Write the live entries to a new file of the next generation and swap it in."""
+        # a catalog written from scratch must not take the generation another process last read
+        generation = self._generation + 1 if self._generation is not None else randbits(62)
+        lines = [HEADER_FORMAT % generation]
+        for name, (mtime, size, ext) in self.entries.items():
+            lines.append("+ %.3f %d %s\n" % (mtime, size, name))
+            if ext:
+                lines.append("z %d %s %s\n" % (size, ext, name))
+        data = "".join(lines).encode("utf-8")
+        part = "%s.%d.part" % (self.filename, os.getpid())
+        with open(part, "wb") as f:
+            f.write(data)
+        os.rename(part, self.filename)
+        self._generation = generation
+        self._offset = len(data)
+        self._lines = len(lines) - 1
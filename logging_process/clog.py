@@ -1,14 +1,26 @@
 import io
+import locale
 import os
+import random
+import re
 import sys
 import time
+import threading
+import traceback
 
-from portalocker import LOCK_EX, lock, unlock
+from portalocker import LOCK_EX, LOCK_NB, lock, unlock
+from portalocker.exceptions import LockException
 from contextlib import contextmanager
 from secrets import randbits
 
 from logging.handlers import BaseRotatingHandler, TimedRotatingFileHandler
-from logging import FileHandler
+from logging import FileHandler, ERROR, NOTSET, getLevelName
+from string import Formatter
+
+from .catalog import BackupCatalog
+from .compress import COMPRESSORS, RotatedFileWorker, compress_file, compressed_name, strip_compressed_extension
+from .index import TimeParser, build_index, remove_index, rename_index, retarget_index
+from .stats import HandlerStats
 
 
 _MIDNIGHT = 24 * 60 * 60  # number of seconds in a day
@@ -17,16 +29,177 @@ PY2 = False
 if sys.version_info[0] == 2:
     PY2 = True
 
+LOCK_FALLBACKS = ('error', 'buffer', 'drop')
+
+
+class LockTimeout(RuntimeError):
+    """The file lock could not be acquired within lockTimeout seconds."""
+
+
+_fdatasync = getattr(os, 'fdatasync', os.fsync)
+
+
+def _sync_path(path):
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except (IOError, OSError):
+        return
+    try:
+        _fdatasync(fd)
+    finally:
+        os.close(fd)
+
+
+def suffix_regex(suffix):
+    """Regular expression matching what time.strftime(suffix) produces."""
+    widths = {'Y': 4, 'm': 2, 'd': 2, 'H': 2, 'M': 2, 'S': 2, 'y': 2, 'j': 3}
+    pattern = []
+    for part in re.split(r"(%.)", suffix):
+        if len(part) == 2 and part[0] == "%":
+            pattern.append(r"\d{%d}" % widths[part[1]] if part[1] in widths else ".+?")
+        else:
+            pattern.append(re.escape(part))
+    return "".join(pattern)
+
+
+def timed_backups(baseFilename, nameFormat, suffix, filenamePattern=None):
+    """
+    The backups of a time rotated log file named by nameFormat, compressed
+    or not, as a list of (start of their period, path). Compressions still in
+    progress (*.part) never match. filenamePattern, a regular expression,
+    replaces the file name to match the backups of several files at once.
+    按nameFormat查找按时间切分的备份文件，返回(时间段开始时间, 路径)列表。
+    """
+    basePath, filename = os.path.split(baseFilename)
+    pattern = []
+    for literal, field, _, _ in Formatter().parse(nameFormat):
+        pattern.append(re.escape(literal))
+        if field == "basePath":
+            pattern.append(re.escape(basePath))
+        elif field == "filename":
+            pattern.append(filenamePattern or re.escape(filename))
+        elif field == "suffix":
+            pattern.append("(?P<suffix>%s)" % suffix_regex(suffix))
+    extensions = "|".join(re.escape(ext) for ext, _ in COMPRESSORS.values())
+    matcher = re.compile("^%s(?:%s)?$" % ("".join(pattern), extensions))
+    dirName = os.path.dirname(nameFormat.format(basePath=basePath, filename=filename, suffix=""))
+    result = []
+    for fileName in os.listdir(dirName or "."):
+        path = os.path.join(dirName, fileName)
+        m = matcher.match(path)
+        if m:
+            try:
+                key = time.mktime(time.strptime(m.group("suffix"), suffix))
+            except (ValueError, OverflowError):
+                continue
+            result.append((key, path))
+    return result
+
 
 # 根据开源包 ConcurrentRotatingFileHandler 抽象出的文件锁类
 class ConcurrentLock(FileHandler):
-    def __init__(self, filename, mode='a', encoding=None, delay=False, umask=None):
+    def __init__(self, filename, mode='a', encoding=None, delay=False, umask=None, keepOpen=False,
+                 atomicAppend=False, atomicMaxBytes=4096, sizeSyncInterval=64, compress=None, collectStats=False,
+                 statsInterval=None, statsFile=None, lockTimeout=None, lockBackoff=0.001, lockMaxBackoff=0.05,
+                 lockFallback='error', lockBufferSize=10000, compressDelay=None, indexInterval=None, timePattern=None,
+                 timeFormat=None, fsyncRecords=None, fsyncInterval=None, fsyncLevel=None, maxTotalBytes=None,
+                 maxAgeDays=None, ring=False, ringSlotSize=512, ringSlots=4096, ringDrainCount=256, ringInterval=0.1):
         """
         Use the specified filename for streamed logging
+
+        If keepOpen is true the log file and the lock file stay open between
+        records instead of being reopened for every emit(). Rotation done by
+        another process is detected by comparing the inode/device of the held
+        descriptor with the path, and only then is the log file reopened.
+        keepOpen为True时日志文件和锁文件在两次写入之间保持打开，通过inode判断文件是否已被其它进程切分。
+
+        If atomicAppend is true each record (message + terminator) is encoded
+        and written with a single os.write() on a shared O_APPEND descriptor,
+        which POSIX systems append atomically, and the file lock is only taken
+        around doRollover(). Records longer than atomicMaxBytes after encoding
+        take the locked path instead.
+        atomicAppend为True时每条日志用一次O_APPEND写入，只有切分日志时才加文件锁。
+
+        The size of the live file is tracked as the bytes this process wrote
+        on top of the last os.fstat() of the descriptor it writes to, and is
+        resynced every sizeSyncInterval writes, whenever the descriptor
+        changes, and before a rollover is decided under the lock.
+
+        compress ('gzip', 'bz2' or 'lzma') compresses rotated files in a
+        background thread after the lock has been released; see compress.py.
+        The thread waits compressDelay seconds after each rollover first, by
+        default 1 with atomicAppend and 0 otherwise: atomicAppend writers do
+        not take the lock, so one that checked the file just before another
+        process rotated it may still append a record to the rotated file,
+        which must not have been compressed and removed by then. Backups
+        that keep being modified (the .1 backup of a file rotating faster
+        than every compressDelay seconds) or change during compression stay
+        uncompressed, and close() may wait for the delay.
+        compress可选gzip/bz2/lzma，切分后的文件在后台线程中压缩；atomicAppend时默认延迟1秒再压缩，避免丢失迟到的写入。
+
+        With indexInterval (bytes, e.g. 64 * 1024) the same thread first
+        writes a timestamp index of every rotated file, with an entry every
+        indexInterval bytes; see index.py. timePattern and timeFormat say how
+        to find the timestamp of a line, as for reader.LogReader.
+        indexInterval不为None时为切分后的文件建立时间索引，供reader快速定位。
+
+        Records are only flushed to the operating system by default. The
+        fsync options make them durable with fdatasync(): after every
+        fsyncRecords records, when the oldest unsynced record is
+        fsyncInterval seconds old (a background thread covers idle periods),
+        and right away for a record at or above fsyncLevel, or a batch
+        (buffered handlers, BackgroundHandler, the writer process, the
+        aggregator) holding one. Any combination may be given. One call covers every record written since the last
+        one, so a burst shares a single fdatasync(), and it is made after the
+        file lock is released so that the other processes keep writing
+        meanwhile. Rollovers sync the file before renaming it.
+        fsync选项控制落盘：每N条、每T秒或达到某个级别时调用一次fdatasync，期间的日志共用这一次调用。
+
+        On top of backupCount, rollovers delete the oldest backups while all
+        of them together (compressed size once compressed) exceed
+        maxTotalBytes, and those rotated more than maxAgeDays days ago. What
+        to delete is decided from the catalog of backups kept in
+        `.__file.backups` (see catalog.py), without listing the directory.
+        maxTotalBytes和maxAgeDays按备份总大小和天数删除旧文件，依据备份目录文件，不遍历目录。
+
+        With ring=True records are copied into a ring buffer shared by all
+        processes through `.__file.ring` (ringSlots slots of ringSlotSize
+        bytes) and written to the log file in batches by whichever process
+        holds the file lock: after every ringDrainCount records and every
+        ringInterval seconds if the lock is free, on drainRing(), when a
+        handler is created or closed (records left by crashed processes) and
+        before any record that has to take the locked path. See ring.py; POSIX
+        only. The fsync options count records as they are drained, and a
+        record at or above fsyncLevel drains the ring and syncs right away.
+        ring为True时日志先写入共享内存环形缓冲，再由持有文件锁的进程批量写入文件。
+
+        collectStats enables the counters and timings returned by stats(), see
+        stats.py. With statsInterval they are also appended as a JSON line to
+        statsFile (by default `.__file.stats` next to the lock file) every
+        statsInterval seconds and on close().
+        collectStats为True时统计等锁、持锁、写入和切分耗时，可定期写入statsFile。
+
+        With lockTimeout None the file lock is waited for in a blocking call.
+        Otherwise it is tried without blocking and retried after a random
+        sleep of up to lockBackoff seconds, doubling up to lockMaxBackoff,
+        until lockTimeout seconds have passed. A record that could not get
+        the lock is then handled according to lockFallback:
+
+        * ``error``: LockTimeout goes to handleError(), as any other error;
+        * ``buffer``: the record is kept in memory (at most lockBufferSize
+          records) and written before the next record that gets the lock;
+        * ``drop``: the record is dropped and counted in ``dropped``.
+
+        Every such failure is counted in ``lockFailures``. With atomicAppend
+        only rollovers need the lock; if it times out the record is written
+        anyway and the rollover is tried again with the next record.
+        lockTimeout为None时阻塞等锁，否则非阻塞重试（指数退避加随机抖动），超时后按lockFallback处理。
         """
         self.mode = mode
         self.encoding = encoding
         FileHandler.__init__(self, filename, mode, encoding, delay)
+        # Without delay StreamHandler falls back to sys.stderr because _open() returns None.
+        self.stream = None
 
         self.terminator = "\n"
         self.lockFilename = self.getLockFilename()
@@ -34,6 +207,66 @@ class ConcurrentLock(FileHandler):
         self.stream_lock = None
         self.umask = umask
         self.unicode_error_policy = 'ignore'
+        self.keepOpen = keepOpen
+        self.atomicAppend = atomicAppend
+        self.atomicMaxBytes = atomicMaxBytes
+        self._lock_pid = None
+        self._stream_pid = None
+        self._append_fd = None
+        self._append_encoding = encoding or locale.getpreferredencoding(False)
+        self.sizeSyncInterval = sizeSyncInterval
+        self._size = None
+        self._size_writes = 0
+        if compress and compress not in COMPRESSORS:
+            raise ValueError("compress must be one of %s" % (sorted(COMPRESSORS),))
+        self.compress = compress
+        self.indexInterval = indexInterval
+        self._index_parser = TimeParser(timePattern, timeFormat) if indexInterval else None
+        if compressDelay is None:
+            compressDelay = 1.0 if atomicAppend else 0
+        self.compressDelay = compressDelay
+        self._rotated_worker = None
+        if compress or indexInterval:
+            self._rotated_worker = RotatedFileWorker(self._process_rotated, delay=compressDelay)
+        self._stats = None
+        if collectStats:
+            self._stats = HandlerStats(statsInterval, statsFile or self.getSidecarFilename("stats"))
+        self._locked_at = 0
+        if lockFallback not in LOCK_FALLBACKS:
+            raise ValueError("lockFallback must be one of %s" % (LOCK_FALLBACKS,))
+        self.lockTimeout = lockTimeout
+        self.lockBackoff = lockBackoff
+        self.lockMaxBackoff = lockMaxBackoff
+        self.lockFallback = lockFallback
+        self.lockBufferSize = lockBufferSize
+        self.lockFailures = 0
+        self.dropped = 0
+        self._pending = []
+        self._pending_pid = None
+        if isinstance(fsyncLevel, str):
+            fsyncLevel = getLevelName(fsyncLevel)
+        self.fsyncRecords = fsyncRecords
+        self.fsyncInterval = fsyncInterval
+        self.fsyncLevel = fsyncLevel
+        self._fsync = bool(fsyncRecords or fsyncInterval or fsyncLevel is not None)
+        self._unsynced = 0
+        self._unsynced_since = 0
+        self._syncer = None
+        self._syncer_pid = None
+        self._syncer_stop = threading.Event()
+        self.maxTotalBytes = maxTotalBytes
+        self.maxAgeDays = maxAgeDays
+        self.catalog = BackupCatalog(self.getSidecarFilename("backups"), self._scan_backups)
+        self._ring = None
+        if ring:
+            from .ring import RingBuffer, ring_filename
+            with self._alter_umask():
+                self._ring = RingBuffer(ring_filename(self.lockFilename), ringSlotSize, ringSlots)
+        self.ringDrainCount = ringDrainCount
+        self.ringInterval = ringInterval
+        self._ring_puts = 0
+        self._drainer_pid = None
+        self._drainer_stop = threading.Event()
 
     def getLockFilename(self):
         """
@@ -51,13 +284,43 @@ class ConcurrentLock(FileHandler):
         lock_name = ".__" + lock_name
         return os.path.join(lock_path, lock_name)
 
+    def getSidecarFilename(self, ext):
+        """
+        Name of a hidden state file shared by all processes logging to this
+        file, next to the lock file: `.__file.<ext>` for file.log.
+        """
+        return self.lockFilename[:-len(".lock")] + "." + ext
+
+    def stats(self, reset=False):
+        """
+        Snapshot of the counters and timings of this handler in this process,
+        or None unless the handler was created with collectStats=True.
+        """
+        if self._stats is None:
+            return None
+        snapshot = self._stats.snapshot()
+        if reset:
+            self._stats.reset()
+        return snapshot
+
+    def handleError(self, record):
+        if self._stats is not None:
+            self._stats.errors += 1
+        FileHandler.handleError(self, record)
+
     def _open_lockfile(self):
         if self.stream_lock and not self.stream_lock.closed:
-            return
+            if self._lock_pid == os.getpid():
+                return
+            # Inherited across fork(): flock() belongs to the open file description,
+            # which parent and child would share, so the child needs its own.
+            self.stream_lock.close()
+            self.is_locked = False
         lock_file = self.lockFilename
 
         with self._alter_umask():
             self.stream_lock = open(lock_file, "wb", buffering=0)
+        self._lock_pid = os.getpid()
 
     def _open(self, mode=None):
         # Normally we don't hold the stream open. Only do_open does that
@@ -91,6 +354,88 @@ class ConcurrentLock(FileHandler):
             finally:
                 os.umask(prev_umask)
 
+    def _sync_stream(self):
+        """
+        Return a stream for the file currently at baseFilename, reusing the held
+        one unless the file was rotated (inode/device changed) or removed, or the
+        stream was inherited from a parent process. Call with the lock held.
+        返回当前日志文件的流，只有文件被切分过（inode变化）时才重新打开。
+        """
+        stream = self.stream
+        if stream is not None and not stream.closed and self._stream_pid == os.getpid():
+            if self._is_current(stream.fileno()):
+                return stream
+        self._close()
+        self.stream = self.do_open()
+        self._stream_pid = os.getpid()
+        self._size = None
+        return self.stream
+
+    def _is_current(self, fd):
+        """Whether fd still refers to the file at baseFilename."""
+        try:
+            st = os.stat(self.baseFilename)
+        except OSError:
+            return False
+        fst = os.fstat(fd)
+        return st.st_ino == fst.st_ino and st.st_dev == fst.st_dev
+
+    def _sync_append_fd(self):
+        """
+        Return the O_APPEND descriptor used by atomicAppend, reopening it when
+        the file was rotated or the descriptor was inherited from a parent.
+        """
+        fd = self._append_fd
+        if fd is not None and self._append_pid == os.getpid() and self._is_current(fd):
+            return fd
+        self._close_append_fd()
+        flags = os.O_WRONLY | os.O_APPEND | os.O_CREAT | getattr(os, 'O_BINARY', 0)
+        with self._alter_umask():
+            self._append_fd = os.open(self.baseFilename, flags, 0o666)
+        self._append_pid = os.getpid()
+        self._size = None
+        return self._append_fd
+
+    def _close_append_fd(self):
+        fd = self._append_fd
+        self._append_fd = None
+        if fd is not None:
+            os.close(fd)
+
+    def _size_fd(self):
+        """The descriptor the next write goes to, opening it if necessary."""
+        if self.atomicAppend:
+            if self._append_fd is not None and self._append_pid == os.getpid():
+                return self._append_fd
+            return self._sync_append_fd()
+        if self.keepOpen:
+            return self._sync_stream().fileno()
+        # Opened once per record and reused by do_write().
+        if self.stream is None:
+            self.stream = self.do_open()
+            self._size = None
+        return self.stream.fileno()
+
+    def _tracked_size(self, limit):
+        """
+        Size of the live log file, from the running count of bytes written by
+        this process. Writes from other processes are picked up at the next
+        resync, so the estimate may lag by up to sizeSyncInterval writes.
+        """
+        fd = self._size_fd()
+        size = self._size
+        if size is None or self._size_writes >= self.sizeSyncInterval or (size >= limit and self.is_locked):
+            size = self._size = os.fstat(fd).st_size
+            self._size_writes = 0
+        return size
+
+    def _count_written(self, nbytes):
+        if self._size is not None:
+            self._size += nbytes
+        self._size_writes += 1
+        if self._stats is not None:
+            self._stats.bytes += nbytes
+
     def _close(self):
         """ Close file stream.  Unlike close(), we don't tear anything down, we
         expect the log to be re-opened after rotation."""
@@ -108,11 +453,50 @@ class ConcurrentLock(FileHandler):
         """Does nothing; stream is flushed on each write."""
         return
 
+    def close(self):
+        """
+        Close the stream and, in keepOpen mode, the held lock file.
+        """
+        self.acquire()
+        try:
+            self._write_pending()
+            if self._ring is not None:
+                self._drainer_stop.set()
+                # noinspection PyBroadException
+                try:
+                    self.drainRing()
+                except Exception:
+                    traceback.print_exc()
+                self._ring.close()
+                self._ring = None
+            if self._unsynced:
+                self._sync_records()
+            self._syncer_stop.set()
+            self._close_append_fd()
+            if self.stream_lock:
+                if not self.stream_lock.closed:
+                    self.stream_lock.close()
+                self.stream_lock = None
+        finally:
+            self.release()
+        if self._rotated_worker is not None:
+            self._rotated_worker.join()
+        if self._stats is not None and self._stats.interval:
+            self._stats.dump(self.baseFilename)
+        FileHandler.close(self)
+
     def do_write(self, msg):
-        """Handling writing an individual record; we do a fresh open every time.
-        This assumes emit() has already locked the file."""
-        self.stream = self.do_open()
-        stream = self.stream
+        """Handling writing an individual record; we do a fresh open every time
+        unless keepOpen is set. This assumes emit() has already locked the file."""
+        if self.atomicAppend:
+            self._write_fd(self._sync_append_fd(), self._encode_record(msg))
+            return
+        if self.keepOpen:
+            stream = self._sync_stream()
+        else:
+            if self.stream is None:
+                self.stream = self.do_open()
+            stream = self.stream
         if PY2:
             self.do_write_py2(msg)
         else:
@@ -131,9 +515,22 @@ class ConcurrentLock(FileHandler):
                     raise
 
         stream.flush()
-        self._close()
+        # Characters rather than bytes; exact for ASCII and corrected at the next resync.
+        self._count_written(len(msg))
+        if not self.keepOpen:
+            self._close()
         return
 
+    def _encode_record(self, msg):
+        return (msg + self.terminator).encode(self._append_encoding, self.unicode_error_policy)
+
+    def _write_fd(self, fd, data):
+        written = os.write(fd, data)
+        # A short write only happens on errors such as a full disk; finish the record anyway.
+        while written < len(data):
+            written += os.write(fd, data[written:])
+        self._count_written(written)
+
     # noinspection PyCompatibility,PyUnresolvedReferences
     def do_write_py2(self, msg):
         stream = self.stream
@@ -158,49 +555,524 @@ class ConcurrentLock(FileHandler):
         if self.is_locked:
             raise   # already locked... recursive?
         self._open_lockfile()
+        stats = self._stats
+        if stats is not None:
+            started = time.time()
         if self.stream_lock:
-            for i in range(10):
-                # noinspection PyBroadException
-                try:
-                    lock(self.stream_lock, LOCK_EX)
-                    self.is_locked = True
-                    break
-                except Exception:
-                    continue
+            if self.lockTimeout is None:
+                lock(self.stream_lock, LOCK_EX)
             else:
-                raise RuntimeError("Cannot acquire lock after 10 attempts")
+                self._lock_with_backoff()
+            self.is_locked = True
+        if stats is not None:
+            self._locked_at = time.time()
+            stats.lockWait.add(self._locked_at - started)
+
+    def _try_lock(self):
+        """Take the file lock if no other process holds it, without waiting."""
+        self._open_lockfile()
+        try:
+            lock(self.stream_lock, LOCK_EX | LOCK_NB)
+        except LockException:
+            self._do_unlock()
+            return False
+        self.is_locked = True
+        if self._stats is not None:
+            self._locked_at = time.time()
+        return True
+
+    def _lock_with_backoff(self):
+        deadline = time.time() + self.lockTimeout
+        backoff = self.lockBackoff
+        while True:
+            try:
+                lock(self.stream_lock, LOCK_EX | LOCK_NB)
+                return
+            except LockException:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    raise LockTimeout("Cannot acquire lock on %s within %ss" % (self.lockFilename, self.lockTimeout))
+            if self._stats is not None:
+                self._stats.lockRetries += 1
+            # full jitter, so that processes woken together do not retry together
+            time.sleep(min(random.uniform(0, backoff), remaining))
+            backoff = min(backoff * 2, self.lockMaxBackoff)
+
+    def _lock_failed(self, error, msg, count):
+        """Apply lockFallback to a write that could not get the lock."""
+        self.lockFailures += 1
+        if self._stats is not None:
+            self._stats.lockFailures += 1
+        if self.lockFallback == 'buffer' and sum(c for _, c in self._pending) + count <= self.lockBufferSize:
+            self._pending.append((msg, count))
+            self._pending_pid = os.getpid()
+        elif self.lockFallback == 'error':
+            raise error
+        else:
+            self.dropped += count
+
+    def _take_pending(self, msg, count):
+        """Prepend the records kept by lockFallback='buffer' to this write."""
+        pending = self._pending
+        self._pending = []
+        if self._pending_pid != os.getpid():
+            # Forked child: the kept records belong to the parent.
+            return msg, count
+        pending.append((msg, count))
+        return self.terminator.join(m for m, _ in pending), sum(c for _, c in pending)
+
+    def _write_pending(self):
+        """Last attempt at writing the records kept by lockFallback='buffer'."""
+        if not self._pending or self._pending_pid != os.getpid():
+            self._pending = []
+            return
+        pending = self._pending
+        self._pending = []
+        # noinspection PyBroadException
+        try:
+            self._write_record(self.terminator.join(m for m, _ in pending), count=sum(c for _, c in pending))
+        except Exception:
+            self._pending = pending
+        self.dropped += sum(c for _, c in self._pending)
+        self._pending = []
 
     def _do_unlock(self):
         if self.stream_lock:
             if self.is_locked:
                 unlock(self.stream_lock)
                 self.is_locked = False
-            self.stream_lock.close()
-            self.stream_lock = None
+                if self._stats is not None:
+                    self._stats.lockHold.add(time.time() - self._locked_at)
+            if not self.keepOpen:
+                self.stream_lock.close()
+                self.stream_lock = None
+        if not self.keepOpen:
+            self._close()
+
+    def _schedule_rotated(self, path):
+        """Hand a just rotated file to the background thread, if any."""
+        if self._rotated_worker is not None:
+            self._rotated_worker.submit(path)
+
+    def _process_rotated(self, path):
+        # index first: compression replaces path
+        if self.indexInterval:
+            build_index(path, self.indexInterval, self._index_parser)
+        if self.compress:
+            compress_file(path, self.compress, self.lockFilename, self._compressed, self.compressDelay)
+
+    def _compressed(self, source, dest, st):
+        # called by compress_file() with the file lock held
+        with self._alter_umask():
+            self.catalog.load()
+            self.catalog.compressed(source, dest[len(source):], os.stat(dest).st_size)
+        if self.indexInterval:
+            retarget_index(source, dest, st)
+
+    def _scan_backups(self):
+        """The paths of the existing backups, oldest first, to rebuild the catalog."""
+        return []
+
+    def _expire_backups(self, now=None):
+        """Delete the backups beyond backupCount, maxTotalBytes and maxAgeDays. Call with the lock held."""
+        catalog = self.catalog
+        for name in catalog.expired(self.backupCount, self.maxTotalBytes, self.maxAgeDays, now):
+            self._remove_backup(catalog.path(name))
+            catalog.remove(name)
+
+    def _backup_names(self, path):
+        """The names a backup may have: as rotated and, with compress, compressed."""
+        if self.compress:
+            return path, compressed_name(path, self.compress)
+        return path,
+
+    def _remove_backup(self, path):
+        path = strip_compressed_extension(path)
+        for name in self._backup_names(path):
+            try:
+                os.remove(name)
+            except (IOError, OSError):
+                pass
+        if self.indexInterval:
+            remove_index(path)
+
+    def _write_record(self, msg, levelno=None, count=1):
+        """
+        Write a formatted record (or a batch of count records joined with the
+        terminator) by whichever path the handler is configured for. levelno
+        is the level of the record, or the highest level in the batch, and is
+        what fsyncLevel is compared with.
+        """
+        if self._pending:
+            msg, count = self._take_pending(msg, count)
+        queued = False
+        if self._ring is not None:
+            # records left in the ring count for the fsync options once drained
+            queued = self._ring_write(msg, levelno, count)
+            written = queued or self._locked_write(msg, count)
+        elif self.atomicAppend:
+            written = self._append_write(msg, count)
+        else:
+            written = self._locked_write(msg, count)
+        if written and self._fsync and not queued:
+            self._maybe_sync(levelno, count)
+        if self._stats is not None:
+            if written:
+                self._stats.records += count
+            self._stats.maybe_dump(self.baseFilename)
+
+    def _count_unsynced(self, count):
+        if not self._unsynced:
+            self._unsynced_since = time.time()
+        self._unsynced += count
+
+    def _maybe_sync(self, levelno, count):
+        """Apply the fsync options to count records just written, with the lock released."""
+        self._count_unsynced(count)
+        if not self._unsynced:
+            return
+        if ((self.fsyncRecords and self._unsynced >= self.fsyncRecords)
+                or (self.fsyncLevel is not None and levelno is not None and levelno >= self.fsyncLevel)
+                or (self.fsyncInterval and time.time() - self._unsynced_since >= self.fsyncInterval)):
+            self._sync_records()
+        elif self.fsyncInterval and self._syncer_pid != os.getpid():
+            # threads do not survive fork(), start one for this process
+            self._syncer_pid = os.getpid()
+            self._syncer_stop = threading.Event()
+            self._syncer = threading.Thread(target=self._sync_loop, name="logging_process-fsync")
+            self._syncer.daemon = True
+            self._syncer.start()
+
+    def _sync_loop(self):
+        stop = self._syncer_stop
+        while not stop.wait(self.fsyncInterval):
+            self.acquire()
+            try:
+                if self._unsynced and self._syncer_pid == os.getpid():
+                    self._sync_records()
+            except Exception:
+                traceback.print_exc()
+            finally:
+                self.release()
+
+    def _sync_records(self):
+        """
+        fdatasync() the file the unsynced records went to: through the held
+        descriptor when there is one (the O_APPEND one of atomicAppend and
+        of ring drains), which still refers to that file if it was rotated
+        since; otherwise through the current file, since the process
+        rotating it synced it before the rename.
+        """
+        self._unsynced = 0
+        stats = self._stats
+        if stats is not None:
+            started = time.time()
+        if self._append_fd is not None and self._append_pid == os.getpid():
+            _fdatasync(self._append_fd)
+        elif self.keepOpen and self.stream is not None and not self.stream.closed \
+                and self._stream_pid == os.getpid():
+            self.stream.flush()
+            _fdatasync(self.stream.fileno())
+        else:
+            _sync_path(self.baseFilename)
+        if stats is not None:
+            stats.fsyncs += 1
+            stats.fsync.add(time.time() - started)
+
+    def _ring_write(self, msg, levelno, count):
+        """
+        Copy msg into the ring. False when it does not fit in a slot or the
+        ring is full: the locked path then drains the ring and writes msg.
+        """
+        if not self._ring.put(self._encode_record(msg)):
+            return False
+        self._ring_puts += count
+        if self.fsyncLevel is not None and levelno is not None and levelno >= self.fsyncLevel:
+            # once we hold the lock the record is in the file, whichever process drained it
+            self._drain_ring(True, sync=True)
+        elif self._ring_puts >= self.ringDrainCount:
+            self.drainRing(blocking=False)
+        if self.ringInterval and self._drainer_pid != os.getpid():
+            # threads do not survive fork(), start one for this process
+            self._drainer_pid = os.getpid()
+            self._drainer_stop = threading.Event()
+            drainer = threading.Thread(target=self._drain_loop, name="logging_process-ring")
+            drainer.daemon = True
+            drainer.start()
+        return True
+
+    def _drain_loop(self):
+        stop = self._drainer_stop
+        while not stop.wait(self.ringInterval):
+            # noinspection PyBroadException
+            try:
+                if self._drainer_pid == os.getpid():
+                    self.drainRing(blocking=False)
+            except Exception:
+                traceback.print_exc()
+
+    def drainRing(self, blocking=True):
+        """
+        Append the committed records of the ring to the log file now. Without
+        blocking give up at once if another process holds the file lock
+        (it is then the one draining). Return whether the ring was drained.
+        """
+        return self._drain_ring(blocking)
+
+    def _recover_ring(self):
+        """
+        Write what crashed processes left in the ring. Called at the end of
+        the constructors, once the rollover condition can be evaluated.
+        """
+        if self._ring is None:
+            return
+        try:
+            self.drainRing()
+        except LockTimeout:
+            # whoever holds the lock drains before its next locked write or on its own drains
+            pass
+
+    def _drain_ring(self, blocking, sync=False):
+        """drainRing(), then fdatasync() if sync, otherwise apply the fsync options."""
+        self.acquire()
+        try:
+            if self._ring is None:
+                return False
+            self._ring_puts = 0
+            if blocking:
+                self._do_lock()
+            elif not self._try_lock():
+                return False
+            try:
+                try:
+                    # every process drains, so measure the file instead of counting our writes
+                    self._size = None
+                    if self.atomicAppend:
+                        self._sync_append_fd()
+                    if self.shouldRollover(None):
+                        self._rollover()
+                except Exception:
+                    pass
+                self._drain_locked()
+            finally:
+                self._do_unlock()
+            if sync:
+                self._sync_records()
+            elif self._fsync:
+                self._maybe_sync(None, 0)
+            return True
+        finally:
+            self.release()
+
+    def _drain_locked(self):
+        """
+        Write the committed records of the ring in one write, counting each
+        slot as a record for the fsync options. Call with the file lock held.
+        """
+        slots = self._ring.committed()
+        if not slots:
+            return
+        self._timed_write(self._write_fd, self._sync_append_fd(), b"".join(data for _, _, data in slots))
+        self._ring.free([i for _, i, _ in slots])
+        if self._fsync:
+            self._count_unsynced(len(slots))
+
+    def _rollover(self):
+        """doRollover(), timed when collecting stats."""
+        if self._fsync:
+            # records of every process are in the file about to be renamed
+            if self.keepOpen and self.stream is not None and not self.stream.closed:
+                self.stream.flush()
+            _sync_path(self.baseFilename)
+        if self._stats is None:
+            self.doRollover()
+            return
+        started = time.time()
+        self.doRollover()
+        self._stats.rollovers += 1
+        self._stats.rollover.add(time.time() - started)
+
+    def _timed_write(self, write, *args):
+        if self._stats is None:
+            write(*args)
+            return
+        started = time.time()
+        write(*args)
+        self._stats.write.add(time.time() - started)
+
+    def _append_write(self, msg, count=1):
+        """
+        Lock-free path of atomicAppend: one os.write() per record on the shared
+        O_APPEND descriptor. The lock is only taken to roll over, and the
+        rollover condition is checked again once it is held because another
+        process may have rolled over in the meantime.
+        无锁追加写入，只有需要切分时才加锁。
+        """
+        data = self._encode_record(msg)
+        if len(data) > self.atomicMaxBytes:
+            return self._locked_write(msg, count)
+        fd = self._sync_append_fd()
+        if self.shouldRollover(None):
+            try:
+                try:
+                    self._do_lock()
+                except LockTimeout:
+                    # write without rolling over, the next record tries again
+                    self.lockFailures += 1
+                    if self._stats is not None:
+                        self._stats.lockFailures += 1
+                    self._timed_write(self._write_fd, fd, data)
+                    return True
+                try:
+                    self._sync_append_fd()
+                    if self.shouldRollover(None):
+                        self._rollover()
+                except Exception:
+                    pass
+            finally:
+                self._do_unlock()
+            fd = self._sync_append_fd()
+        self._timed_write(self._write_fd, fd, data)
+        return True
+
+    def _locked_write(self, msg, count=1):
+        """
+        Take the file lock, roll over if needed and write msg (one record, or
+        several already joined with the terminator). Return whether msg was
+        written, which it is not when the lock timed out.
+        加锁，判断是否需要切分，然后写入。
+        """
+        try:
+            try:
+                self._do_lock()
+            except LockTimeout as e:
+                self._lock_failed(e, msg, count)
+                return False
+            try:
+                if self.atomicAppend:
+                    self._sync_append_fd()
+                if self.shouldRollover(None):
+                    self._rollover()
+            except Exception:
+                pass
+            if self._ring is not None:
+                self._drain_locked()
+            self._timed_write(self.do_write, msg)
+        finally:
+            self._do_unlock()
+        return True
 
 
 # 继承TimedRotatingFileHandler类，然后修改了doRollover方法，和emit方法
 class MyTimedRotatingFileHandler(TimedRotatingFileHandler, ConcurrentLock):
-    def __init__(self, filename, when='h', interval=1, backupCount=0, encoding=None, delay=False, utc=False, atTime=None):
+    # records written between two checks of a held descriptor against the file at baseFilename
+    statInterval = 64
+    _stat_countdown = 0
+
+    def __init__(self, filename, when='h', interval=1, backupCount=0, encoding=None, delay=False, utc=False, atTime=None,
+                 **kwargs):
         TimedRotatingFileHandler.__init__(self, filename, when, interval, backupCount, encoding, delay, utc, atTime)
-        ConcurrentLock.__init__(self, filename, 'a', encoding, delay)
+        ConcurrentLock.__init__(self, filename, 'a', encoding, delay, **kwargs)
         self.nameFormat = "{basePath}/{filename}.{suffix}"
+        # 所有进程共享的切分时间点，第一个越过时间点的进程负责切分，其它进程只更新rolloverAt
+        self.stateFilename = self.getSidecarFilename("rollover")
+        self._share_rollover_state()
+        self._recover_ring()
+
+    def _share_rollover_state(self):
+        """
+        Agree on rolloverAt with the other processes from the start: adopt the
+        published one if it is still ahead, otherwise publish ours. Computed
+        from the file's mtime, a later boundary would let this process keep
+        appending through its held descriptor to the already rotated file.
+        创建时即与其它进程统一切分时间点。
+        """
+        try:
+            self._do_lock()
+        except LockTimeout:
+            # rolloverAt may differ from the other processes', check the file every record
+            self.statInterval = 1
+            return
+        try:
+            now = time.time()
+            shared = self._read_rollover_state()
+            if shared is not None and shared > now:
+                self.rolloverAt = shared
+            elif self.rolloverAt > now:
+                self._write_rollover_state(self.rolloverAt)
+        finally:
+            self._do_unlock()
 
     def shouldRollover(self, record):
         del record
         return self._shouldRollover()
 
     def _shouldRollover(self):
-        self.stream = self.do_open()
-        t = int(time.time())
-        if t >= self.rolloverAt:
-            return 1
-        self._close()
-        return 0
+        # Pure clock comparison: no file is opened or stat()ed per record.
+        return time.time() >= self.rolloverAt
+
+    def _is_current(self, fd):
+        # Rotation by this package only happens at the rolloverAt shared since
+        # construction and doRollover() closes our descriptors, so the stat()
+        # only has to notice an external logrotate or rm: once every
+        # statInterval records is enough.
+        self._stat_countdown -= 1
+        if self._stat_countdown > 0:
+            return True
+        self._stat_countdown = self.statInterval
+        return ConcurrentLock._is_current(self, fd)
+
+    def _read_rollover_state(self):
+        try:
+            with open(self.stateFilename) as f:
+                return int(f.read())
+        except (IOError, OSError, ValueError):
+            return None
+
+    def _write_rollover_state(self, rolloverAt):
+        try:
+            with self._alter_umask():
+                with open(self.stateFilename, "w") as f:
+                    f.write("%d\n" % rolloverAt)
+        except (IOError, OSError):
+            pass
+
+    def getFilesToDelete(self):
+        """
+        Determine the files to delete when rolling over: the oldest backups
+        beyond backupCount, maxTotalBytes and maxAgeDays, read from the
+        catalog instead of listing the directory. Call with the lock held.
+        根据备份目录查找需要删除的旧日志文件，包括压缩后的文件。
+        """
+        catalog = self.catalog
+        catalog.load()
+        return [catalog.path(name)
+                for name in catalog.expired(self.backupCount, self.maxTotalBytes, self.maxAgeDays)]
+
+    def _scan_backups(self):
+        """
+        The backups following nameFormat, compressed or not, by period.
+        Compressions still in progress (*.part) never match.
+        """
+        return [path for _, path in sorted(timed_backups(self.baseFilename, self.nameFormat, self.suffix))]
 
     def doRollover(self):
+        """
+        Called with the lock held once the clock passes rolloverAt. The shared
+        state file holds the rollover time of the current log file: if another
+        process has already rotated past our boundary we only adopt its
+        rolloverAt and reopen, otherwise we rotate and publish the new one.
+        """
         self._close()
+        self._close_append_fd()
         currentTime = int(time.time())
+        shared = self._read_rollover_state()
+        if shared is not None:
+            if shared > currentTime:
+                self.rolloverAt = shared
+                return
+            # the current file belongs to the period ending at the shared boundary
+            self.rolloverAt = shared
         dstNow = time.localtime(currentTime)[-1]
         t = self.rolloverAt - self.interval
         if self.utc:
@@ -221,12 +1093,19 @@ class MyTimedRotatingFileHandler(TimedRotatingFileHandler, ConcurrentLock):
         dfn = self.nameFormat.format(basePath=basePath, filename=filename, suffix=time.strftime(self.suffix, timeTuple))
         # if os.path.exists(dfn):
         #     os.remove(dfn)
-        if not os.path.exists(dfn) and os.path.exists(self.baseFilename):
-            os.rename(self.baseFilename, dfn)
-
-        if self.backupCount > 0:
-            for s in self.getFilesToDelete():
-                os.remove(s)
+        with self._alter_umask():
+            self.catalog.load()
+            # a backup missing from the catalog (lost or rewritten) must not be overwritten either
+            if dfn not in self.catalog and not any(os.path.exists(name) for name in self._backup_names(dfn)):
+                try:
+                    size = os.stat(self.baseFilename).st_size
+                    os.rename(self.baseFilename, dfn)
+                except (IOError, OSError):
+                    pass
+                else:
+                    self.catalog.add(dfn, currentTime, size)
+                    self._schedule_rotated(dfn)
+            self._expire_backups(currentTime)
         if not self.delay:
             self.stream = self.do_open()
         newRolloverAt = self.computeRollover(currentTime)
@@ -241,6 +1120,7 @@ class MyTimedRotatingFileHandler(TimedRotatingFileHandler, ConcurrentLock):
                     addend = 3600
                 newRolloverAt += addend
         self.rolloverAt = newRolloverAt
+        self._write_rollover_state(newRolloverAt)
 
     def emit(self, record):
         """
@@ -249,16 +1129,7 @@ class MyTimedRotatingFileHandler(TimedRotatingFileHandler, ConcurrentLock):
         # noinspection PyBroadException
         try:
             msg = self.format(record)
-            try:
-                self._do_lock()
-                try:
-                    if self.shouldRollover(record):
-                        self.doRollover()
-                except Exception as e:
-                    pass
-                self.do_write(msg)
-            finally:
-                self._do_unlock()
+            self._write_record(msg, record.levelno)
 
         except (KeyboardInterrupt, SystemExit):
             raise
@@ -273,27 +1144,42 @@ class MyRotatingFileHandler(BaseRotatingHandler, ConcurrentLock):
     next when the current file reaches a certain size. Multiple processes can
     write to the log file concurrently, but this may mean that the file will
     exceed the given size.
+
+    With sequenceBackups=True rotated files are named file.log.00000001,
+    file.log.00000002, ... (higher is newer) instead of shifting .1 ... .N on
+    every rollover, so a rollover is one rename plus at most one delete of the
+    oldest backup. Either way the existing backups are known from the
+    catalog next to the lock file (see catalog.py) instead of probing the
+    directory.
+    sequenceBackups为True时备份文件按递增序号命名，切分时只需一次rename和最多一次删除。
     """
-    def __init__(self, filename, mode='a', maxBytes=0, backupCount=0, encoding=None, delay=None):
+    def __init__(self, filename, mode='a', maxBytes=0, backupCount=0, encoding=None, delay=None,
+                 sequenceBackups=False, **kwargs):
 
         self.maxBytes = maxBytes
         self.backupCount = backupCount
+        self.sequenceBackups = sequenceBackups
 
         # Construct the handler with the given arguments in "delayed" mode
         # because we will handle opening the file as needed. File name
         # handling is done by FileHandler since Python 2.5.
         BaseRotatingHandler.__init__(self, filename, mode, encoding=encoding, delay=True)
-        ConcurrentLock.__init__(self, filename, mode, encoding=encoding, delay=True)
+        ConcurrentLock.__init__(self, filename, mode, encoding=encoding, delay=True, **kwargs)
+        self._recover_ring()
 
     def doRollover(self):
         """
         Do a rollover, as described in __init__().
         """
         self._close()
+        self._size = None
         if self.backupCount <= 0:
             self.stream = self.do_open("w")
             self._close()
             return
+        if self.sequenceBackups:
+            self._sequenceRollover()
+            return
 
         tmpname = None
         while not tmpname or os.path.exists(tmpname):
@@ -304,18 +1190,119 @@ class MyRotatingFileHandler(BaseRotatingHandler, ConcurrentLock):
         except (IOError, OSError):
             return
 
-        def do_rename(source_fn, dest_fn):
-            if os.path.exists(dest_fn):
-                os.remove(dest_fn)
-            if os.path.exists(source_fn):
-                os.rename(source_fn, dest_fn)
-        for i in range(self.backupCount - 1, 0, -1):
-            sfn = "%s.%d" % (self.baseFilename, i)
-            dfn = "%s.%d" % (self.baseFilename, i + 1)
-            if os.path.exists(sfn):
-                do_rename(sfn, dfn)
-        dfn = self.baseFilename + ".1"
-        do_rename(tmpname, dfn)
+        with self._alter_umask():
+            catalog = self.catalog
+            catalog.load()
+            size = os.stat(tmpname).st_size
+            for _ in range(2):
+                expired = catalog.expired(self.backupCount, self.maxTotalBytes, self.maxAgeDays, count=1, size=size)
+                plan = self._shift_plan(expired)
+                if plan is not None:
+                    break
+                # the catalog misses backups that are on disk: rebuild it rather than rename over them
+                catalog.rebuild()
+            else:
+                self._restore_live(tmpname)
+                return
+            # nothing is deleted before it is known that the shift can be done
+            for name in expired:
+                self._remove_backup(catalog.path(name))
+            # shift .i to .i+1, oldest first so that nothing is overwritten
+            shifted = []
+            for source, dest, mtime, entrySize, ext in plan:
+                try:
+                    os.rename(source + ext, dest + ext)
+                except (IOError, OSError):
+                    continue
+                if self.indexInterval:
+                    rename_index(source, dest)
+                shifted.append((dest, mtime, entrySize, ext))
+            dfn = self.baseFilename + ".1"
+            os.rename(tmpname, dfn)
+            shifted.append((dfn, time.time(), size, ""))
+            catalog.replace(shifted)
+        self._schedule_rotated(dfn)
+
+    def _shift_plan(self, expired):
+        """
+        The renames shifting every backup of the catalog but expired from .i
+        to .i+1, oldest first, as (source, dest, mtime, size, ext); None if
+        one of them, or the new .1, would replace a file that is not itself
+        being shifted.
+        """
+        catalog = self.catalog
+        plan = []
+        # the expired backups are removed before the renames
+        freed = set()
+        for name in expired:
+            freed.update(self._backup_names(strip_compressed_extension(catalog.path(name))))
+        for name, (mtime, entrySize, ext) in catalog.entries.items():
+            if name not in expired:
+                source = os.path.join(catalog.dirName, name)
+                dest = "%s.%d" % (self.baseFilename, int(name.rsplit(".", 1)[1]) + 1)
+                plan.append((source, dest, mtime, entrySize, ext))
+        sources = set(source + ext for source, _, _, _, ext in plan)
+        for dest in [dest + ext for _, dest, _, _, ext in plan] + [self.baseFilename + ".1"]:
+            if dest not in sources and dest not in freed and os.path.lexists(dest):
+                return None
+        return plan
+
+    def _restore_live(self, tmpname):
+        """
+        Put the records of a rollover that cannot be done back into the live
+        file: tmpname becomes it again, or is appended to it if another
+        process (atomicAppend) has created it meanwhile.
+        """
+        try:
+            os.link(tmpname, self.baseFilename)
+        except (IOError, OSError):
+            flags = os.O_WRONLY | os.O_APPEND | os.O_CREAT | getattr(os, 'O_BINARY', 0)
+            fd = os.open(self.baseFilename, flags, 0o666)
+            try:
+                with open(tmpname, 'rb') as f:
+                    while True:
+                        data = f.read(1 << 20)
+                        if not data:
+                            break
+                        self._write_fd(fd, data)
+            finally:
+                os.close(fd)
+        os.remove(tmpname)
+
+    def sequenceFilename(self, seq):
+        return "%s.%08d" % (self.baseFilename, seq)
+
+    def _scan_backups(self):
+        """
+        The .1 ... .N backups, or with sequenceBackups the .00000001 ones,
+        compressed or not, oldest first.
+        """
+        dirName, baseName = os.path.split(self.baseFilename)
+        extensions = "|".join(re.escape(ext) for ext, _ in COMPRESSORS.values())
+        digits = r"\d{8}" if self.sequenceBackups else r"\d{1,7}"
+        pattern = re.compile(r"^%s\.(%s)(?:%s)?$" % (re.escape(baseName), digits, extensions))
+        backups = []
+        for fileName in os.listdir(dirName):
+            m = pattern.match(fileName)
+            if m:
+                backups.append((int(m.group(1)), os.path.join(dirName, fileName)))
+        backups.sort(reverse=not self.sequenceBackups)
+        return [path for _, path in backups]
+
+    def _sequenceRollover(self):
+        with self._alter_umask():
+            catalog = self.catalog
+            catalog.load()
+            last = next(reversed(catalog.entries), None)
+            dfn = self.sequenceFilename(int(last.rsplit(".", 1)[1]) + 1 if last else 1)
+            try:
+                size = os.stat(self.baseFilename).st_size
+                os.rename(self.baseFilename, dfn)
+            except (IOError, OSError):
+                return
+            catalog.add(dfn, time.time(), size)
+            self._expire_backups()
+        self._schedule_rotated(dfn)
 
     def shouldRollover(self, record):
         """
@@ -331,13 +1318,7 @@ class MyRotatingFileHandler(BaseRotatingHandler, ConcurrentLock):
 
     def _shouldRollover(self):
         if self.maxBytes > 0:  # are we rolling over?
-            self.stream = self.do_open()
-            try:
-                self.stream.seek(0, 2)  # due to non-posix-compliant Windows feature
-                if self.stream.tell() >= self.maxBytes:
-                    return True
-            finally:
-                self._close()
+            return self._tracked_size(self.maxBytes) >= self.maxBytes
         return False
 
     def emit(self, record):
@@ -347,18 +1328,146 @@ class MyRotatingFileHandler(BaseRotatingHandler, ConcurrentLock):
         # noinspection PyBroadException
         try:
             msg = self.format(record)
-            try:
-                self._do_lock()
-                try:
-                    if self.shouldRollover(record):
-                        self.doRollover()
-                except Exception as e:
-                    pass
-                self.do_write(msg)
-            finally:
-                self._do_unlock()
+            self._write_record(msg, record.levelno)
 
         except (KeyboardInterrupt, SystemExit):
             raise
         except Exception:
-            self.handleError(record)
\ No newline at end of file
+            self.handleError(record)
+
+
+# 缓冲写入：先在内存中攒一批日志，再一次加锁、一次切分判断、一次写入
+class ConcurrentBuffer(object):
+    """
+    Mixin that buffers formatted records in memory and writes them as one
+    batch under a single lock acquisition, rollover check and write.
+
+    The buffer is flushed when it holds flushCount records or flushBytes
+    characters, when the oldest buffered record is flushInterval seconds old
+    (never if it is None or 0), on flush()/close() (logging.shutdown() calls
+    both at exit), and right away for records at or above flushLevel so
+    crash diagnostics are not lost.
+    """
+    def _init_buffer(self, flushCount=100, flushBytes=64 * 1024, flushInterval=1.0, flushLevel=ERROR):
+        if isinstance(flushLevel, str):
+            flushLevel = getLevelName(flushLevel)
+        self.flushCount = flushCount
+        self.flushBytes = flushBytes
+        self.flushInterval = flushInterval
+        self.flushLevel = flushLevel
+        self._buffer = []
+        self._buffer_bytes = 0
+        self._buffer_since = 0
+        self._buffer_level = NOTSET
+        self._buffer_record = None
+        self._buffer_pid = os.getpid()
+        self._flusher = None
+        self._flusher_stop = threading.Event()
+
+    def _reset_buffer(self):
+        self._buffer = []
+        self._buffer_bytes = 0
+        self._buffer_level = NOTSET
+        self._buffer_record = None
+
+    def _start_flusher(self):
+        # The age threshold must also fire when no further records arrive.
+        if self.flushInterval and self.flushInterval > 0:
+            self._flusher = threading.Thread(target=self._flush_loop, name="logging_process-flusher")
+            self._flusher.daemon = True
+            self._flusher.start()
+
+    def _flush_loop(self):
+        stop = self._flusher_stop
+        while not stop.wait(self.flushInterval):
+            if self._buffer and time.time() - self._buffer_since >= self.flushInterval:
+                self.flush()
+
+    def emit(self, record):
+        """
+        Format the record and add it to the buffer, writing the buffer out if
+        one of the thresholds is reached.
+        """
+        # noinspection PyBroadException
+        try:
+            msg = self.format(record)
+            if self._buffer_pid != os.getpid():
+                # Forked child: the buffered records belong to the parent.
+                self._reset_buffer()
+                self._buffer_pid = os.getpid()
+                self._flusher = None
+                self._flusher_stop = threading.Event()
+            if self._flusher is None:
+                self._start_flusher()
+            if not self._buffer:
+                self._buffer_since = time.time()
+            self._buffer.append(msg)
+            self._buffer_bytes += len(msg)
+            self._buffer_level = max(self._buffer_level, record.levelno)
+            self._buffer_record = record
+            if (record.levelno >= self.flushLevel or len(self._buffer) >= self.flushCount
+                    or self._buffer_bytes >= self.flushBytes
+                    or (self.flushInterval and time.time() - self._buffer_since >= self.flushInterval)):
+                self._flush_buffer()
+        except (KeyboardInterrupt, SystemExit):
+            raise
+        except Exception:
+            self.handleError(record)
+
+    def _flush_buffer(self):
+        if not self._buffer or self._buffer_pid != os.getpid():
+            return
+        record = self._buffer_record
+        levelno = self._buffer_level
+        count = len(self._buffer)
+        msg = self.terminator.join(self._buffer)
+        self._reset_buffer()
+        # noinspection PyBroadException
+        try:
+            # the batch is synced as soon as any of its records is at fsyncLevel
+            self._write_record(msg, levelno, count)
+        except (KeyboardInterrupt, SystemExit):
+            raise
+        except Exception:
+            self.handleError(record)
+
+    def flush(self):
+        """
+        Write out all buffered records.
+        """
+        self.acquire()
+        try:
+            self._flush_buffer()
+        finally:
+            self.release()
+
+    def close(self):
+        """
+        Flush the buffer and stop the background flusher before closing.
+        """
+        try:
+            self.flush()
+            self._flusher_stop.set()
+        finally:
+            super(ConcurrentBuffer, self).close()
+
+
+class MyBufferedTimedRotatingFileHandler(ConcurrentBuffer, MyTimedRotatingFileHandler):
+    """
+    MyTimedRotatingFileHandler that writes records in batches, see ConcurrentBuffer.
+    """
+    def __init__(self, filename, when='h', interval=1, backupCount=0, encoding=None, delay=False, utc=False, atTime=None,
+                 flushCount=100, flushBytes=64 * 1024, flushInterval=1.0, flushLevel=ERROR, **kwargs):
+        MyTimedRotatingFileHandler.__init__(self, filename, when, interval, backupCount, encoding, delay, utc, atTime,
+                                            **kwargs)
+        self._init_buffer(flushCount, flushBytes, flushInterval, flushLevel)
+
+
+class MyBufferedRotatingFileHandler(ConcurrentBuffer, MyRotatingFileHandler):
+    """
+    MyRotatingFileHandler that writes records in batches, see ConcurrentBuffer.
+    """
+    def __init__(self, filename, mode='a', maxBytes=0, backupCount=0, encoding=None, delay=None,
+                 flushCount=100, flushBytes=64 * 1024, flushInterval=1.0, flushLevel=ERROR, **kwargs):
+        MyRotatingFileHandler.__init__(self, filename, mode, maxBytes, backupCount, encoding, delay, **kwargs)
+        self._init_buffer(flushCount, flushBytes, flushInterval, flushLevel)
@@ -0,0 +1,151 @@
+"""
+Compression of rotated log files, done by a background thread so that it
+never runs while the other processes wait for the file lock. The same
+thread writes their timestamp index, see index.py.
+切分后的日志文件在后台线程中压缩（及建立时间索引），不占用文件锁。
+"""
+import bz2
+import gzip
+import lzma
+import os
+import shutil
+import threading
+import time
+import traceback
+
+from portalocker import LOCK_EX, lock, unlock
+
+try:
+    from queue import Queue
+except ImportError:  # pragma: no cover
+    from Queue import Queue
+
+COMPRESSORS = {
+    'gzip': ('.gz', gzip.open),
+    'bz2': ('.bz2', bz2.open),
+    'lzma': ('.xz', lzma.open),
+}
+
+COMPRESSED_EXTENSIONS = tuple(ext for ext, _ in COMPRESSORS.values())
+
+# Suffix of a compression in progress; such files are never counted as backups.
+PART_SUFFIX = ".part"
+
+
+def compressed_name(path, method):
+    return path + COMPRESSORS[method][0]
+
+
+def strip_compressed_extension(path):
+    for ext in COMPRESSED_EXTENSIONS:
+        if path.endswith(ext):
+            return path[:-len(ext)]
+    return path
+
+
+def compress_file(source, method, lockFilename=None, swapped=None, minAge=0):
+    """
+    Compress source into source + extension through a .part file, then swap
+    it in while holding the log's file lock. If source was renamed meanwhile
+    (the classic .1 ... .N scheme shifts backups) or a late writer appended
+    to it, the compressed copy is discarded and the backup simply stays
+    uncompressed. atomicAppend writers do not take the lock, so compression
+    waits until source has not been modified for minAge seconds, since one
+    of them may still be about to append to it (see compressDelay of
+    ConcurrentLock), and gives up if it keeps changing. swapped(source, dest,
+    st) is called once dest replaced source, whose os.stat() result was st,
+    with the lock still held.
+    Return the compressed file name, or None.
+    """
+    dest = compressed_name(source, method)
+    # several processes may be compressing different files that had the same name
+    part = "%s.%d%s" % (dest, os.getpid(), PART_SUFFIX)
+    opener = COMPRESSORS[method][1]
+    for _ in range(3):
+        try:
+            age = time.time() - os.stat(source).st_mtime
+        except (IOError, OSError):
+            return None
+        if age >= minAge:
+            break
+        time.sleep(minAge - age)
+    else:
+        # still being written to, e.g. the .1 backup is already a newer file than the one rotated
+        return None
+    try:
+        with open(source, "rb") as src:
+            # inode numbers are reused once compressed sources are removed, so compare more than st_ino
+            st = os.fstat(src.fileno())
+            identity = (st.st_ino, st.st_size, st.st_mtime_ns)
+            with opener(part, "wb") as dst:
+                shutil.copyfileobj(src, dst, 1 << 20)
+        stream_lock = open(lockFilename, "wb", buffering=0) if lockFilename else None
+        try:
+            if stream_lock:
+                lock(stream_lock, LOCK_EX)
+            try:
+                st = os.stat(source)
+                if (st.st_ino, st.st_size, st.st_mtime_ns) != identity:
+                    os.remove(part)
+                    return None
+            except (IOError, OSError):
+                os.remove(part)
+                return None
+            os.rename(part, dest)
+            os.remove(source)
+            if swapped is not None:
+                swapped(source, dest, st)
+        finally:
+            if stream_lock:
+                unlock(stream_lock)
+                stream_lock.close()
+        return dest
+    except (IOError, OSError):
+        try:
+            os.remove(part)
+        except (IOError, OSError):
+            pass
+        return None
+
+
+class RotatedFileWorker(object):
+    """
+    A lazily started background thread calling func(path) on the rotated
+    files handed to submit(), one after the other, each no sooner than delay
+    seconds after it was submitted.
+    """
+    def __init__(self, func, name="logging_process-rotated", delay=0):
+        self.func = func
+        self.name = name
+        self.delay = delay
+        self._queue = Queue()
+        self._thread = None
+        self._pid = os.getpid()
+
+    def submit(self, path):
+        if self._thread is None or self._pid != os.getpid():
+            # threads do not survive fork(), start one for this process
+            self._queue = Queue()
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name=self.name)
+            self._thread.daemon = True
+            self._thread.start()
+        self._queue.put((time.time() + self.delay, path))
+
+    def _run(self):
+        while True:
+            due, path = self._queue.get()
+            try:
+                wait = due - time.time()
+                if wait > 0:
+                    time.sleep(wait)
+                self.func(path)
+            except Exception:
+                traceback.print_exc()
+            finally:
+                self._queue.task_done()
+
+    def join(self):
+        """Wait for the submitted files to be processed."""
+        if self._thread is not None and self._pid == os.getpid():
+            self._queue.join()
@@ -26,14 +26,23 @@ LOGGING_DIC = {
             'format': standard_format
         },
         'simple': {
+            # '()': 'logging_process.FastFormatter',  # 更快的格式化，输出与logging.Formatter完全一致
             'format': simple_format
         },
         'less_simple': {
             'format': id_simple_format
         },
+        # 每条日志输出一行JSON，extra中的字段也会输出
+        # 'json': {
+        #     '()': 'logging_process.JsonFormatter',
+        #     'fields': ['asctime', 'levelname', 'name', 'filename', 'funcName', 'lineno', 'message'],
+        # },
     },
     # 过滤器，决定哪个log记录被输出
-    'filters': {},
+    'filters': {
+        # 同一位置的同一条日志60秒内只输出前10条，其余汇总为一条
+        # 'burst': {'()': 'logging_process.BurstFilter', 'burst': 10, 'window': 60},
+    },
     # 负责将Log message 分派到指定的destination(目的地)
     'handlers': {
         # 打印到终端的日志
@@ -52,6 +61,14 @@ LOGGING_DIC = {
             'when': 'd',  # 每天生成一个文件
             'backupCount': 60,  # 备份60个日志文件
             'encoding': 'utf-8',  # 日志文件的编码，再也不用担心中文log乱码了
+            # 'keepOpen': True,  # 保持日志文件和锁文件打开，不再每条日志都open/close，文件被切分后自动重新打开
+            # 'compress': 'gzip',  # 切分后的日志在后台线程压缩，可选gzip/bz2/lzma
+            # 'indexInterval': 64 * 1024,  # 为切分后的日志建立时间索引，reader按时间读取时无需扫描整个文件
+            # 'collectStats': True, 'statsInterval': 60,  # 统计等锁/持锁/写入/切分耗时，每60秒写入.__<文件名>.stats
+            # 'lockTimeout': 0.5, 'lockFallback': 'buffer',  # 等锁超过0.5秒时先缓存在内存中，下次写入时一并写入
+            # 'fsyncRecords': 100, 'fsyncLevel': 'ERROR',  # 每100条或遇到ERROR时fdatasync落盘，期间的日志共用一次调用
+            # 'maxTotalBytes': 10 * 1024 ** 3, 'maxAgeDays': 30,  # 备份总大小超过10G或超过30天的旧文件在切分时删除
+            # 'ring': True,  # 日志先写入共享内存环形缓冲，由持有文件锁的进程批量写入文件
         },
         # 打印到importance文件的日志,收集error及以上的日志
         'importance': {
@@ -0,0 +1,161 @@
+"""
+Suppression of bursts of the same record, before they reach the file lock.
+日志风暴抑制：同一位置的同一条日志在时间窗口内只输出前K条，其余抽样或丢弃，窗口结束时输出一条汇总。
+
+    'filters': {
+        'burst': {'()': 'logging_process.BurstFilter', 'burst': 10, 'window': 60},
+    },
+    'handlers': {
+        'importance': {..., 'filters': ['burst']},
+    },
+
+Records are the same when they come from the same logger, level, format
+string and code location, whatever their arguments. The first burst of
+them in a window of window seconds pass, then one in sampleEvery (none
+with 0), and once the window is over one summary record is logged in
+their place: a record of the same logger, level and location with the
+message "suppressed N similar records in Ws: <format string>" and the
+attribute ``suppressed`` set to N.
+"""
+import atexit
+import logging
+import threading
+import weakref
+from collections import OrderedDict
+
+# every BurstFilter, to log the summaries of open windows at exit
+_filters = weakref.WeakSet()
+
+
+class BurstFilter(logging.Filter):
+    """
+    logging.Filter that lets through the first burst records of every kind
+    per window seconds and one in sampleEvery of the rest. At most maxKeys
+    kinds are tracked, least recently seen dropped first, so every record
+    costs a dict lookup and, now and then, closing a window.
+
+    Summaries go to the handlers of the logger hierarchy of the record that
+    have this filter, or through the logger if the filter is on the logger
+    itself, so they go exactly where the suppressed records would have
+    gone; pass target (a logger or a handler) to send them somewhere else.
+    They are logged when a record arrives after the window, when a kind is
+    dropped from the table, on flush() and at exit, before
+    logging.shutdown() closes the handlers.
+
+    One instance may be shared by several handlers (dictConfig does so for
+    every handler listing it): each record is counted once and gets the
+    same decision, and every one of them gets the summaries.
+    """
+    def __init__(self, name='', burst=10, window=60.0, sampleEvery=0, maxKeys=10000, target=None):
+        logging.Filter.__init__(self, name)
+        self.burst = burst
+        self.window = window
+        self.sampleEvery = sampleEvery
+        self.maxKeys = maxKeys
+        self.target = target
+        self.suppressed = 0
+        # key -> [window start, records seen, records suppressed, first suppressed record], least recently seen first
+        self._kinds = OrderedDict()
+        # the same states in the order their windows were opened, i.e. will close
+        self._windows = OrderedDict()
+        self._lock = threading.Lock()
+        # the last record filtered in this thread and whether it passed
+        self._last = threading.local()
+        _filters.add(self)
+
+    def filter(self, record):
+        if not logging.Filter.filter(self, record):
+            return False
+        if getattr(record, 'suppressed', None) is not None:
+            # one of our summaries
+            return True
+        last = self._last
+        ref = getattr(last, 'record', None)
+        if ref is not None and ref() is record:
+            # the same record reaching another handler that shares this filter
+            return last.allowed
+        try:
+            key = (record.name, record.levelno, record.msg, record.pathname, record.lineno)
+            hash(key)
+        except TypeError:
+            key = (record.name, record.levelno, str(record.msg), record.pathname, record.lineno)
+        now = record.created
+        with self._lock:
+            closed = self._close_windows(now)
+            state = self._kinds.get(key)
+            if state is None:
+                state = self._kinds[key] = self._windows[key] = [now, 0, 0, None]
+                if len(self._kinds) > self.maxKeys:
+                    evictedKey, evicted = self._kinds.popitem(last=False)
+                    del self._windows[evictedKey]
+                    if evicted[2]:
+                        closed.append(evicted)
+            else:
+                self._kinds.move_to_end(key)
+            state[1] += 1
+            excess = state[1] - self.burst
+            allowed = excess <= 0 or (self.sampleEvery and excess % self.sampleEvery == 0)
+            if not allowed:
+                state[2] += 1
+                self.suppressed += 1
+                if state[3] is None:
+                    state[3] = record
+        last.record = weakref.ref(record)
+        last.allowed = bool(allowed)
+        for state in closed:
+            self._summarize(state)
+        return last.allowed
+
+    def _close_windows(self, now):
+        """Forget the kinds whose window is over; return those with suppressed records."""
+        closed = []
+        windows = self._windows
+        end = now - self.window
+        while windows:
+            key, state = next(iter(windows.items()))
+            if state[0] > end:
+                break
+            del windows[key]
+            del self._kinds[key]
+            if state[2]:
+                closed.append(state)
+        return closed
+
+    def _summarize(self, state):
+        start, _, suppressed, record = state
+        summary = logging.LogRecord(record.name, record.levelno, record.pathname, record.lineno,
+                                    "suppressed %d similar records in %gs: %s",
+                                    (suppressed, self.window, record.msg), None, record.funcName)
+        summary.suppressed = suppressed
+        if self.target is not None:
+            self.target.handle(summary)
+            return
+        logger = logging.getLogger(record.name)
+        if self in logger.filters:
+            logger.handle(summary)
+            return
+        while logger is not None:
+            for handler in logger.handlers:
+                if self in handler.filters:
+                    handler.handle(summary)
+            logger = logger.parent if logger.propagate else None
+
+    def flush(self):
+        """Log the summaries of every open window now, e.g. before exiting."""
+        with self._lock:
+            closed = [state for state in self._kinds.values() if state[2]]
+            self._kinds.clear()
+            self._windows.clear()
+        for state in closed:
+            self._summarize(state)
+
+
+@atexit.register
+def _flush_filters():
+    # registered after logging's own hook, so it runs before logging.shutdown()
+    for f in list(_filters):
+        # noinspection PyBroadException
+        try:
+            f.flush()
+        except Exception:
+            pass
@@ -0,0 +1,291 @@
+"""
+Drop-in replacement for logging.Formatter that formats the same %-style
+format strings faster, with byte-identical output.
+快速格式化：格式串只解析一次，时间按秒缓存，代码位置按位置缓存，输出与logging.Formatter完全一致。
+
+    'formatters': {
+        'simple': {'()': 'logging_process.FastFormatter', 'format': simple_format},
+    },
+
+JsonFormatter writes each record as one JSON object per line instead:
+JsonFormatter每条日志输出一行JSON，方便下游解析。
+
+    'formatters': {
+        'json': {'()': 'logging_process.JsonFormatter',
+                 'fields': ['asctime', 'levelname', 'name', 'funcName', 'lineno', 'message']},
+    },
+"""
+import json
+import logging
+import re
+import time
+from json.encoder import encode_basestring, encode_basestring_ascii
+from operator import itemgetter
+
+# %(name)<flags><width><.precision><conversion>, or a literal %%
+_FIELD = re.compile(r"%\((\w+)\)([#0+ -]*\d*(?:\.\d+)?[diouxXeEfFgGcrsa])|%%")
+
+# attributes that only depend on where the logging call is
+LOCATION_FIELDS = frozenset(('pathname', 'filename', 'module', 'funcName', 'lineno'))
+
+LOCATION_CACHE_SIZE = 10000
+
+
+def _tokenize(fmt):
+    """
+    Split fmt into ('text', s) and ('field', name, spec) tokens, or return
+    None when it contains anything the compiled form would not reproduce
+    exactly (a stray %, * widths), so that the stdlib path is used instead.
+    """
+    tokens = []
+    pos = 0
+    for m in _FIELD.finditer(fmt):
+        text = fmt[pos:m.start()]
+        if "%" in text:
+            return None
+        if text:
+            tokens.append(('text', text))
+        if m.group(1) is None:
+            tokens.append(('text', "%%"))
+        else:
+            tokens.append(('field', m.group(1), m.group(2)))
+        pos = m.end()
+    if "%" in fmt[pos:]:
+        return None
+    if fmt[pos:]:
+        tokens.append(('text', fmt[pos:]))
+    return tokens
+
+
+def _is_location(token):
+    return token[0] == 'field' and token[1] in LOCATION_FIELDS
+
+
+def _location_runs(tokens):
+    """
+    Group tokens, replacing every run of two or more location fields (with
+    only text between them) by a ('location', tokens) token.
+    """
+    result = []
+    i = 0
+    while i < len(tokens):
+        if not _is_location(tokens[i]):
+            result.append(tokens[i])
+            i += 1
+            continue
+        end = i + 1
+        fields = 1
+        while True:
+            if end < len(tokens) and _is_location(tokens[end]):
+                end += 1
+            elif end + 1 < len(tokens) and tokens[end][0] == 'text' and _is_location(tokens[end + 1]):
+                end += 2
+            else:
+                break
+            fields += 1
+        if fields > 1:
+            result.append(('location', tokens[i:end]))
+        else:
+            result.append(tokens[i])
+        i = end
+    return result
+
+
+def _make_location(tokens):
+    """Render a run of location fields, caching the result per code location."""
+    fmt = "".join(t[1] if t[0] == 'text' else "%" + t[2] for t in tokens)
+    names = [t[1] for t in tokens if t[0] == 'field']
+    getter = itemgetter(*names)
+    cache = {}
+
+    def location(d):
+        key = getter(d)
+        try:
+            return cache[key]
+        except KeyError:
+            if len(cache) >= LOCATION_CACHE_SIZE:
+                cache.clear()
+            s = cache[key] = fmt % key
+            return s
+    return location
+
+
+def compile_format(fmt):
+    """
+    Compile a %-style format string into a function of the record's
+    __dict__, or return None if it has to be left to logging.Formatter.
+    """
+    tokens = _tokenize(fmt)
+    if tokens is None:
+        return None
+    parts = []
+    args = []
+    namespace = {}
+    for token in _location_runs(tokens):
+        if token[0] == 'text':
+            parts.append(token[1])
+        elif token[0] == 'field':
+            parts.append("%" + token[2])
+            args.append("d[%r]" % token[1])
+        else:
+            name = "_location%d" % len(namespace)
+            namespace[name] = _make_location(token[1])
+            parts.append("%s")
+            args.append("%s(d)" % name)
+    namespace['_fmt'] = "".join(parts)
+    if args:
+        source = "lambda d: _fmt %% (%s,)" % ", ".join(args)
+    else:
+        source = "lambda d: _fmt % ()"
+    return eval(source, namespace)
+
+
+class FastFormatter(logging.Formatter):
+    """
+    logging.Formatter with the same arguments and output, faster for the
+    %-style formats used with the handlers of this package:
+
+    * the format string is compiled once into a function building the
+      argument tuple directly from the record's attributes;
+    * the time.strftime() part of asctime is cached for the current second,
+      only the milliseconds are added per record;
+    * runs of location fields, e.g. %(filename)s-%(funcName)s:%(lineno)d,
+      are rendered once per code location.
+
+    Other styles, and formats using defaults, go through logging.Formatter.
+    The converter is assumed to depend on the whole second only, as
+    time.localtime and time.gmtime do.
+    """
+    def __init__(self, fmt=None, datefmt=None, style='%', *args, **kwargs):
+        logging.Formatter.__init__(self, fmt, datefmt, style, *args, **kwargs)
+        self._render = None
+        # StrFormatStyle and StringTemplateStyle derive from PercentStyle
+        if type(self._style) is logging.PercentStyle and not getattr(self._style, '_defaults', None):
+            self._render = compile_format(self._style._fmt)
+        self._uses_time = self.usesTime()
+        self._time_cache = (None, None, None)
+
+    def formatTime(self, record, datefmt=None):
+        second = int(record.created)
+        cached_second, cached_datefmt, s = self._time_cache
+        if cached_second != second or cached_datefmt != datefmt:
+            s = time.strftime(datefmt or self.default_time_format, self.converter(record.created))
+            self._time_cache = (second, datefmt, s)
+        if not datefmt and self.default_msec_format:
+            s = self.default_msec_format % (s, record.msecs)
+        return s
+
+    def format(self, record):
+        if self._render is None:
+            return logging.Formatter.format(self, record)
+        record.message = record.getMessage()
+        if self._uses_time:
+            record.asctime = self.formatTime(record, self.datefmt)
+        try:
+            s = self._render(record.__dict__)
+        except KeyError as e:
+            raise ValueError('Formatting field not found in record: %s' % e)
+        if record.exc_info:
+            # Cache the traceback text to avoid converting it multiple times
+            if not record.exc_text:
+                record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            if s[-1:] != "\n":
+                s = s + "\n"
+            s = s + record.exc_text
+        if record.stack_info:
+            if s[-1:] != "\n":
+                s = s + "\n"
+            s = s + self.formatStack(record.stack_info)
+        return s
+
+
+# attributes every LogRecord has; any other attribute came from extra
+RECORD_ATTRIBUTES = frozenset(vars(logging.makeLogRecord({}))) | frozenset(('message', 'asctime'))
+
+# what json.dumps() has to escape in a string
+_JSON_ESCAPE = re.compile(r'[\x00-\x1f"\\\x7f-\U0010ffff]')
+
+_FLOAT_CONSTANTS = {float('inf'): 'Infinity', float('-inf'): '-Infinity'}
+
+
+class JsonFormatter(FastFormatter):
+    """
+    Format a record as one line of JSON, the same line as
+    json.dumps(obj, separators=(',', ':'), ensure_ascii=ensureAscii, default=str)
+    of an object holding, in this order:
+
+    * the record attributes named in fields (null when missing), message
+      and asctime being computed as for any formatter;
+    * with extra, the attributes passed in extra=..., in the order given;
+    * exc_info and stack_info, the formatted traceback and stack, when set.
+
+    The ``"key":`` fragments are built once, and strings that are plain
+    ASCII without anything to escape (most messages) are quoted without
+    going through the JSON encoder. Newlines in messages and tracebacks are
+    escaped, so every record stays on a single line.
+    """
+    DEFAULT_FIELDS = ('asctime', 'levelname', 'name', 'message')
+
+    def __init__(self, fields=None, datefmt=None, extra=True, ensureAscii=False):
+        FastFormatter.__init__(self, None, datefmt)
+        self.fields = tuple(fields or self.DEFAULT_FIELDS)
+        self.extra = extra
+        self.ensureAscii = ensureAscii
+        self._encode_string = encode_basestring_ascii if ensureAscii else encode_basestring
+        self._keys = [('{' if i == 0 else ',') + self._encode_string(name) + ':'
+                      for i, name in enumerate(self.fields)]
+        self._uses_time = 'asctime' in self.fields
+        self._uses_message = 'message' in self.fields
+        self._skip = RECORD_ATTRIBUTES | frozenset(self.fields)
+
+    def _encode(self, value):
+        if value.__class__ is str:
+            if _JSON_ESCAPE.search(value) is None:
+                return '"' + value + '"'
+            return self._encode_string(value)
+        if value is None:
+            return 'null'
+        if value is True:
+            return 'true'
+        if value is False:
+            return 'false'
+        if value.__class__ is int:
+            return int.__repr__(value)
+        if value.__class__ is float:
+            if value != value:
+                return 'NaN'
+            return _FLOAT_CONSTANTS.get(value) or float.__repr__(value)
+        return json.dumps(value, separators=(',', ':'), ensure_ascii=self.ensureAscii, default=str)
+
+    def format(self, record):
+        if self._uses_message:
+            record.message = record.getMessage()
+        if self._uses_time:
+            record.asctime = self.formatTime(record, self.datefmt)
+        d = record.__dict__
+        encode = self._encode
+        parts = []
+        for key, name in zip(self._keys, self.fields):
+            parts.append(key)
+            parts.append(encode(d.get(name)))
+        first = not parts
+        if self.extra:
+            skip = self._skip
+            for name, value in d.items():
+                if name not in skip:
+                    parts.append(('{' if first else ',') + self._encode_string(name) + ':')
+                    parts.append(encode(value))
+                    first = False
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            parts.append(('{' if first else ',') + '"exc_info":')
+            parts.append(encode(record.exc_text))
+            first = False
+        if record.stack_info:
+            parts.append(('{' if first else ',') + '"stack_info":')
+            parts.append(encode(self.formatStack(record.stack_info)))
+            first = False
+        parts.append('{}' if first else '}')
+        return ''.join(parts)
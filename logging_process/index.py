@@ -0,0 +1,252 @@
+"""
+Timestamp index of a rotated log file, written next to it when it is
+rotated so that readers can seek to a time without scanning the file, and
+retention can go by time without opening it.
+切分后的日志文件的时间索引：稀疏的(时间, 偏移)对，读取时可直接定位到某个时间点。
+
+The index of access.log.2026-10-16 is the hidden file
+.__access.log.2026-10-16.idx (the same for its compressed version; offsets
+are then those of the uncompressed data). It is little-endian, fixed-width
+and can be memory mapped:
+
+    header, 80 bytes: magic b"LPIX", version (H), entry size (H), stride (I),
+        first timestamp (d), last timestamp (d), lines (Q),
+        size of the indexed data (Q), number of entries (Q),
+        inode (Q) and size (Q) of the file it describes, padding
+    entries, 16 bytes each: timestamp (d), offset of that line (Q)
+
+There is an entry for the first timestamped line at or after every stride
+bytes. Timestamps are POSIX times, NaN when the file has none. An index is
+built in the background and the classic .1 ... .N backups keep moving, so
+it is only used while the inode and size of the file at its name are those
+in its header; compressing the file updates them.
+"""
+import math
+import mmap
+import os
+import re
+import struct
+import time
+
+from .compress import strip_compressed_extension
+
+MAGIC = b"LPIX"
+VERSION = 2
+HEADER = struct.Struct("<4sHHIddQQQQQ12x")
+ENTRY = struct.Struct("<dQ")
+# inode and size of the described file, within HEADER
+IDENTITY = struct.Struct("<QQ")
+IDENTITY_OFFSET = struct.calcsize("<4sHHIddQQQ")
+
+DEFAULT_TIME_PATTERN = br"(\d{4})-(\d\d)-(\d\d)[ T](\d\d):(\d\d):(\d\d)(?:[,.](\d{1,6}))?"
+
+
+class TimeParser(object):
+    """
+    Find and parse the timestamp of a line (bytes). With timeFormat the text
+    matched by timePattern (its first group if it has one) is parsed with
+    time.strptime(); otherwise timePattern must have the groups of
+    DEFAULT_TIME_PATTERN.
+    """
+    def __init__(self, timePattern=None, timeFormat=None):
+        if isinstance(timePattern, str):
+            timePattern = timePattern.encode("ascii")
+        self.pattern = re.compile(timePattern or DEFAULT_TIME_PATTERN)
+        self.timeFormat = timeFormat
+        self._last = (None, None)
+
+    def __call__(self, line):
+        m = self.pattern.search(line)
+        if m is None:
+            return None
+        if self.timeFormat:
+            text = m.group(1 if self.pattern.groups else 0).decode("ascii", "replace")
+            try:
+                return time.mktime(time.strptime(text, self.timeFormat))
+            except (ValueError, OverflowError):
+                return None
+        key = m.group(1, 2, 3, 4, 5, 6)
+        last_key, seconds = self._last
+        if key != last_key:
+            try:
+                seconds = time.mktime(tuple(int(v) for v in key) + (0, 0, -1))
+            except (ValueError, OverflowError):
+                return None
+            self._last = (key, seconds)
+        fraction = m.group(7)
+        if fraction:
+            return seconds + int(fraction) / 10.0 ** len(fraction)
+        return seconds
+
+
+def index_filename(path):
+    """.__access.log.1.idx for access.log.1 and access.log.1.gz"""
+    dirName, name = os.path.split(strip_compressed_extension(path))
+    return os.path.join(dirName, ".__" + name + ".idx")
+
+
+def line_start(m, offset):
+    """Offset of the first line of m starting at or after offset."""
+    if offset == 0:
+        return 0
+    nl = m.find(b"\n", offset - 1)
+    return len(m) if nl < 0 else nl + 1
+
+
+def next_timestamp(m, offset, parse):
+    """(timestamp, offset) of the first line of m with a timestamp at or after offset."""
+    pos = line_start(m, offset)
+    size = len(m)
+    while pos < size:
+        nl = m.find(b"\n", pos)
+        if nl < 0:
+            nl = size
+        ts = parse(m[pos:nl])
+        if ts is not None:
+            return ts, pos
+        pos = nl + 1
+    return None, size
+
+
+def _last_timestamp(m, parse):
+    end = len(m)
+    while end > 0:
+        start = m.rfind(b"\n", 0, end - 1) + 1
+        ts = parse(m[start:end])
+        if ts is not None:
+            return ts
+        end = start
+    return None
+
+
+def build_index(path, stride=64 * 1024, parse=None):
+    """
+    Write the index of the (uncompressed) log file path and return its
+    name, or None if path is empty or gone.
+    """
+    parse = parse or TimeParser()
+    try:
+        f = open(path, "rb")
+    except (IOError, OSError):
+        return None
+    with f:
+        st = os.fstat(f.fileno())
+        size = st.st_size
+        if size == 0:
+            return None
+        m = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            entries = []
+            offset = 0
+            while offset < size:
+                ts, pos = next_timestamp(m, offset, parse)
+                if ts is None:
+                    break
+                if not entries or entries[-1][1] != pos:
+                    entries.append((ts, pos))
+                offset = max(pos + 1, offset + stride)
+            last = _last_timestamp(m, parse)
+            lines = 0
+            for start in range(0, size, 1 << 20):
+                lines += m[start:start + (1 << 20)].count(b"\n")
+        finally:
+            m.close()
+    first = entries[0][0] if entries else float('nan')
+    header = HEADER.pack(MAGIC, VERSION, ENTRY.size, stride, first, float('nan') if last is None else last,
+                         lines, size, len(entries), st.st_ino, size)
+    name = index_filename(path)
+    part = "%s.%d.part" % (name, os.getpid())
+    with open(part, "wb") as out:
+        out.write(header)
+        out.write(b"".join(ENTRY.pack(ts, pos) for ts, pos in entries))
+    os.rename(part, name)
+    return name
+
+
+class LogIndex(object):
+    """A memory mapped index file, see the module docstring."""
+    def __init__(self, m):
+        self._m = m
+        magic, version, entrySize, self.stride, self.first, self.last, self.lines, self.size, self.count, \
+            self.ino, self.fileSize = HEADER.unpack_from(m, 0)
+        if magic != MAGIC or version != VERSION or entrySize != ENTRY.size \
+                or len(m) < HEADER.size + self.count * ENTRY.size:
+            raise ValueError("not a version %d index" % VERSION)
+        if math.isnan(self.first):
+            self.first = None
+        if math.isnan(self.last):
+            self.last = None
+
+    @classmethod
+    def open(cls, path):
+        """
+        The index of the log file path, or None if it has none, not a valid
+        one or one describing another file.
+        """
+        try:
+            st = os.stat(path)
+            with open(index_filename(path), "rb") as f:
+                m = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (IOError, OSError, ValueError):
+            return None
+        try:
+            idx = cls(m)
+        except (ValueError, struct.error):
+            m.close()
+            return None
+        if (idx.ino, idx.fileSize) != (st.st_ino, st.st_size):
+            idx.close()
+            return None
+        return idx
+
+    def entry(self, i):
+        return ENTRY.unpack_from(self._m, HEADER.size + i * ENTRY.size)
+
+    def seek(self, t):
+        """Offset of the last entry before t: reading from there finds every line at or after t."""
+        lo, hi = 0, self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.entry(mid)[0] < t:
+                lo = mid + 1
+            else:
+                hi = mid
+        return self.entry(lo - 1)[1] if lo > 0 else 0
+
+    def close(self):
+        self._m.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def remove_index(path):
+    try:
+        os.remove(index_filename(path))
+    except (IOError, OSError):
+        pass
+
+
+def retarget_index(source, dest, st):
+    """
+    Make the index of source, if it describes the file of os.stat() result
+    st, describe its compressed copy dest instead.
+    """
+    try:
+        with open(index_filename(source), "r+b") as f:
+            if IDENTITY.unpack(os.pread(f.fileno(), IDENTITY.size, IDENTITY_OFFSET)) != (st.st_ino, st.st_size):
+                return
+            dst = os.stat(dest)
+            os.pwrite(f.fileno(), IDENTITY.pack(dst.st_ino, dst.st_size), IDENTITY_OFFSET)
+    except (IOError, OSError, struct.error):
+        pass
+
+
+def rename_index(source, dest):
+    try:
+        os.rename(index_filename(source), index_filename(dest))
+    except (IOError, OSError):
+        pass
@@ -0,0 +1,315 @@
+"""
+Read the records of a time range back from a rotated set of log files.
+按时间范围读取日志：只打开可能包含该时间段的文件，文件内用mmap二分查找起始位置。
+
+    from logging_process.reader import LogReader
+    reader = LogReader('/data/log/example/access.log', nameFormat='{basePath}/{suffix}.{filename}', when='d')
+    for record in reader.read('2026-10-16 14:02', '2026-10-16 14:05'):
+        print(record)
+
+or from the shell::
+
+    python -m logging_process.reader /data/log/example/access.log \\
+        --name-format '{basePath}/{suffix}.{filename}' --start 'yesterday 14:02' --end 'yesterday 14:05'
+
+The files are the live file and its backups under any of the naming
+schemes of this package: nameFormat + suffix of MyTimedRotatingFileHandler,
+the .1 ... .N backups and the .00000001 sequence backups of
+MyRotatingFileHandler, each possibly compressed. A record is a line with a
+timestamp (by default the first YYYY-mm-dd HH:MM:SS[,mmm] in it, i.e. the
+default asctime) plus the lines without one that follow it, such as a
+traceback. Timestamps are assumed to be sorted within skew seconds: records
+are formatted before the file lock is taken, and buffered handlers write
+them up to flushInterval later.
+"""
+import argparse
+import mmap
+import os
+import re
+import sys
+import time
+from datetime import datetime, timedelta
+
+from .clog import timed_backups
+from .compress import COMPRESSORS, strip_compressed_extension
+from .index import LogIndex, TimeParser, line_start, next_timestamp
+
+DEFAULT_NAME_FORMAT = "{basePath}/{filename}.{suffix}"
+
+# the suffixes TimedRotatingFileHandler uses for each value of when
+SUFFIXES = {
+    'S': "%Y-%m-%d_%H-%M-%S",
+    'M': "%Y-%m-%d_%H-%M",
+    'H': "%Y-%m-%d_%H",
+    'D': "%Y-%m-%d",
+    'MIDNIGHT': "%Y-%m-%d",
+    'W': "%Y-%m-%d",
+}
+
+
+def to_timestamp(value):
+    """Accept None, a POSIX timestamp, a datetime or a string, see parse_time()."""
+    if value is None or isinstance(value, (int, float)):
+        return value
+    if isinstance(value, datetime):
+        return time.mktime(value.timetuple()) + value.microsecond / 1e6
+    return parse_time(value)
+
+
+def parse_time(text):
+    """
+    Parse 'YYYY-mm-dd[ HH:MM[:SS]]', 'HH:MM[:SS]' (today) or 'yesterday
+    HH:MM[:SS]' in local time.
+    """
+    text = text.strip()
+    day = None
+    for word, days in (("today", 0), ("yesterday", 1)):
+        if text.startswith(word):
+            day = datetime.now().date() - timedelta(days=days)
+            text = text[len(word):].strip() or "00:00"
+    for fmt in ("%Y-%m-%d %H:%M:%S", "%Y-%m-%d %H:%M", "%Y-%m-%dT%H:%M:%S", "%Y-%m-%d", "%H:%M:%S", "%H:%M"):
+        try:
+            parsed = datetime.strptime(text, fmt)
+        except ValueError:
+            continue
+        if fmt.startswith("%H"):
+            parsed = datetime.combine(day or datetime.now().date(), parsed.time())
+        elif day is not None:
+            break
+        return time.mktime(parsed.timetuple())
+    raise ValueError("cannot parse time %r" % text)
+
+
+def group_records(lines, parse, encoding="utf-8"):
+    """Group lines (bytes, without the newline) into (timestamp, text) records."""
+    ts, record = None, []
+    for line in lines:
+        line_ts = parse(line)
+        if line_ts is not None and record:
+            yield ts, b"\n".join(record).decode(encoding, "replace")
+            record = []
+        if line_ts is not None or not record:
+            ts = line_ts
+        record.append(line)
+    if record:
+        yield ts, b"\n".join(record).decode(encoding, "replace")
+
+
+def iter_records(path, parse, encoding="utf-8"):
+    """Stream the (timestamp, text) records of a log file, compressed or not."""
+    with _open_binary(path) as f:
+        for record in group_records((line.rstrip(b"\n") for line in f), parse, encoding):
+            yield record
+
+
+def _open_binary(path):
+    for ext, opener in COMPRESSORS.values():
+        if path.endswith(ext):
+            return opener(path, "rb")
+    return open(path, "rb")
+
+
+def _mmap_lines(m, pos):
+    size = len(m)
+    while pos < size:
+        nl = m.find(b"\n", pos)
+        if nl < 0:
+            nl = size
+        yield m[pos:nl]
+        pos = nl + 1
+
+
+class LogReader(object):
+    """
+    The log file filename and its backups, as written by the handlers of
+    this package. nameFormat, when and suffix are those of the handler; by
+    default backups under any of the standard suffixes are found.
+    """
+    def __init__(self, filename, nameFormat=DEFAULT_NAME_FORMAT, when=None, suffix=None, timePattern=None,
+                 timeFormat=None, skew=2.0, encoding="utf-8"):
+        self.baseFilename = os.path.abspath(filename)
+        self.nameFormat = nameFormat
+        if suffix is None and when is not None:
+            when = when.upper()
+            suffix = SUFFIXES['W' if when.startswith('W') else when]
+        self.suffix = suffix
+        self.parse = TimeParser(timePattern, timeFormat)
+        self.skew = skew
+        self.encoding = encoding
+
+    def files(self):
+        """
+        All files of the set, oldest first, as (path, start) where start is
+        the beginning of the period of a timed backup and None otherwise.
+        """
+        seen = set()
+        timed = []
+        for suffix in [self.suffix] if self.suffix else sorted(set(SUFFIXES.values())):
+            for start, path in timed_backups(self.baseFilename, self.nameFormat, suffix):
+                if path not in seen:
+                    seen.add(path)
+                    timed.append((start, path))
+        timed.sort()
+        shifted, sequence = [], []
+        dirName, baseName = os.path.split(self.baseFilename)
+        extensions = "|".join(re.escape(ext) for ext, _ in COMPRESSORS.values())
+        pattern = re.compile(r"^%s\.(\d+)(?:%s)?$" % (re.escape(baseName), extensions))
+        for fileName in os.listdir(dirName):
+            m = pattern.match(fileName)
+            path = os.path.join(dirName, fileName)
+            if m and path not in seen:
+                # .00000001 are sequence backups (higher is newer), .1 ... .N shifted ones (higher is older)
+                if len(m.group(1)) == 8:
+                    sequence.append((int(m.group(1)), path))
+                else:
+                    shifted.append((-int(m.group(1)), path))
+        result = [(path, start) for start, path in timed]
+        result += [(path, None) for _, path in sorted(shifted) + sorted(sequence)]
+        if os.path.exists(self.baseFilename):
+            result.append((self.baseFilename, None))
+        # while a backup is being compressed both names may exist; the uncompressed one is complete
+        names = set(path for path, _ in result)
+        return [(path, start) for path, start in result
+                if strip_compressed_extension(path) == path or strip_compressed_extension(path) not in names]
+
+    def first_timestamp(self, path, maxLines=1000):
+        """The timestamp of the first record of path, or None."""
+        idx = LogIndex.open(path)
+        if idx is not None:
+            with idx:
+                if idx.first is not None:
+                    return idx.first
+        try:
+            with _open_binary(path) as f:
+                for n, line in enumerate(f):
+                    ts = self.parse(line)
+                    if ts is not None or n >= maxLines:
+                        return ts
+        except (IOError, OSError, EOFError):
+            pass
+        return None
+
+    def select(self, start=None, end=None):
+        """The paths of the files that can hold records between start and end, oldest first."""
+        start, end = to_timestamp(start), to_timestamp(end)
+        files = self.files()
+        firsts = [None] * len(files)
+
+        def first(i):
+            # the start of a timed backup's period bounds its first record without opening it
+            if firsts[i] is None:
+                firsts[i] = files[i][1] if files[i][1] is not None else self.first_timestamp(files[i][0])
+            return firsts[i]
+        result = []
+        for i, (path, _) in enumerate(files):
+            if end is not None:
+                lo = first(i)
+                if lo is not None and lo >= end + self.skew:
+                    break
+            if start is not None and i + 1 < len(files):
+                hi = first(i + 1)
+                if hi is not None and hi < start - self.skew:
+                    continue
+            result.append(path)
+        return result
+
+    def read(self, start=None, end=None):
+        """
+        Generate the records with start <= timestamp < end (either may be
+        None for an open end) as text, oldest file first.
+        """
+        start, end = to_timestamp(start), to_timestamp(end)
+        for path in self.select(start, end):
+            for record in self.read_file(path, start, end):
+                yield record
+
+    def read_file(self, path, start=None, end=None):
+        """The records of one file between start and end, see read()."""
+        idx = LogIndex.open(path) if start is not None else None
+        if idx is not None:
+            with idx:
+                if idx.last is not None and idx.last < start - self.skew:
+                    return
+                pos = idx.seek(start - self.skew)
+        if strip_compressed_extension(path) != path:
+            with _open_binary(path) as f:
+                if idx is not None:
+                    # the index has offsets of the uncompressed data; seeking still skips parsing
+                    f.seek(pos)
+                lines = (line.rstrip(b"\n") for line in f)
+                for record in self._filter(lines, start, end):
+                    yield record
+            return
+        with open(path, "rb") as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return
+            m = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            try:
+                if idx is None:
+                    pos = self.seek(m, start - self.skew) if start is not None else 0
+                for record in self._filter(_mmap_lines(m, pos), start, end):
+                    yield record
+            finally:
+                m.close()
+
+    def seek(self, m, t):
+        """
+        Binary search the memory mapped file m for the offset of the first
+        line whose record has a timestamp >= t.
+        """
+        lo, hi = 0, len(m)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            ts, offset = next_timestamp(m, mid, self.parse)
+            if ts is None or ts >= t:
+                hi = mid
+            else:
+                lo = offset + 1
+        return line_start(m, lo)
+
+    def _filter(self, lines, start, end):
+        for ts, record in group_records(lines, self.parse, self.encoding):
+            if ts is None:
+                # lines before the first timestamp of a file belong to a record of the previous one
+                if start is None and end is None:
+                    yield record
+                continue
+            if end is not None and ts >= end + self.skew:
+                return
+            if (start is None or ts >= start) and (end is None or ts < end):
+                yield record
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="print the records of a time range of a rotated log file set")
+    parser.add_argument("filename", help="the log file, as configured in the handler")
+    parser.add_argument("--start", help="e.g. '2026-10-16 14:02', '14:02' (today), 'yesterday 14:02'")
+    parser.add_argument("--end", help="end of the range (exclusive), same formats as --start")
+    parser.add_argument("--name-format", default=DEFAULT_NAME_FORMAT, help="nameFormat of the handler")
+    parser.add_argument("--when", help="when of the handler, to know its suffix")
+    parser.add_argument("--suffix", help="strftime suffix of the backups, instead of --when")
+    parser.add_argument("--time-pattern", help="regular expression finding the timestamp in a line")
+    parser.add_argument("--time-format", help="strptime format of the text matched by --time-pattern")
+    parser.add_argument("--skew", type=float, default=2.0, help="seconds records may be out of order")
+    parser.add_argument("--files", action="store_true", help="only list the files that would be read")
+    args = parser.parse_args(argv)
+
+    reader = LogReader(args.filename, args.name_format, args.when, args.suffix, args.time_pattern,
+                       args.time_format, args.skew)
+    try:
+        if args.files:
+            for path in reader.select(args.start, args.end):
+                print(path)
+            return
+        write = sys.stdout.write
+        for record in reader.read(args.start, args.end):
+            write(record)
+            write("\n")
+        sys.stdout.flush()
+    except BrokenPipeError:
+        # output piped into head and the like
+        sys.stderr.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,263 @@
+"""
+Shared memory ring buffer in front of the log file, for bursty
+multiprocess services (POSIX only).
+共享内存环形缓冲：各进程把日志拷贝进mmap的槽位即返回，由持有文件锁的进程批量顺序写入日志文件。
+
+With ring=True the handlers of this package copy every encoded record into
+a slot of the hidden file .__access.ring next to the lock file, mapped by
+every process logging to access.log, instead of taking the file lock. A
+slot is reserved with a non-blocking lockf() on its first bytes; whichever
+process holds the file lock then drains the ring: it appends every
+committed slot, in timestamp order, to the log file in one write (rolling
+over first if needed) and frees them. Processes drain after every
+ringDrainCount records and every ringInterval seconds when they can get
+the file lock without waiting, and before writing a record that does not
+fit in a slot or finds no free slot, which then take the locked path.
+
+Committed slots live in the file, so records of a process that crashed are
+written by the next drain, at the latest when the next handler for the file
+is created or one is closed. A slot being written when its process died is
+never committed: its lockf() lock went away with the process. lockf() locks
+belong to the process, so the rings of one file mapped by several handlers
+of a process also reserve slots under a lock shared by all of them.
+
+A dedicated process can do all the draining::
+
+    python -m logging_process.ring drain --config access.json --interval 0.05
+
+where access.json is a dictConfig-style handler dict, e.g.
+{"class": "logging_process.MyTimedRotatingFileHandler", "filename":
+"/data/log/example/access.log", "when": "d", "ring": true}; and
+``python -m logging_process.ring status FILE`` shows how full a ring is.
+
+Layout: a 64-byte header (magic b"LPRG", version, slot size, slot count)
+and slotCount slots of slotSize bytes, each a 32-byte header (state,
+pid, time, per-process sequence, length, crc32) and the record.
+"""
+import argparse
+import fcntl
+import json
+import mmap
+import os
+import struct
+import sys
+import threading
+import time
+import zlib
+
+MAGIC = b"LPRG"
+VERSION = 1
+HEADER = struct.Struct("<4sHHII48x")
+SLOT = struct.Struct("<IIdQII")
+SLOT_HEADER_SIZE = 32
+
+FREE = 0
+COMMITTED = 1
+
+# slots looked at by put() before the ring counts as full
+MAX_PROBES = 64
+
+# path of a ring -> lock serializing put() and close() across the RingBuffers of this process
+_process_locks = {}
+_process_locks_lock = threading.Lock()
+
+
+def _process_lock(filename):
+    key = os.path.realpath(filename)
+    with _process_locks_lock:
+        lock = _process_locks.get(key)
+        if lock is None:
+            lock = _process_locks[key] = threading.Lock()
+        return lock
+
+
+def _reinit_process_locks():
+    # a lock held by another thread at fork() would never be released in the child
+    global _process_locks_lock
+    _process_locks_lock = threading.Lock()
+    for key in list(_process_locks):
+        _process_locks[key] = threading.Lock()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reinit_process_locks)
+
+
+def ring_filename(lockFilename):
+    """.__access.ring for the lock file .__access.lock"""
+    return lockFilename[:-len(".lock")] + ".ring"
+
+
+class RingBuffer(object):
+    """
+    The ring of one log file, mapped by this process. slotSize and
+    slotCount only apply when the file is created; an existing ring keeps
+    its own geometry.
+    """
+    def __init__(self, filename, slotSize=512, slotCount=4096):
+        self.filename = filename
+        fd = os.open(filename, os.O_RDWR | os.O_CREAT, 0o666)
+        try:
+            fcntl.lockf(fd, fcntl.LOCK_EX, HEADER.size, 0)
+            try:
+                if os.fstat(fd).st_size < HEADER.size:
+                    os.ftruncate(fd, HEADER.size + slotSize * slotCount)
+                    os.pwrite(fd, HEADER.pack(MAGIC, VERSION, 0, slotSize, slotCount), 0)
+                magic, version, _, slotSize, slotCount = HEADER.unpack(os.pread(fd, HEADER.size, 0))
+                if magic != MAGIC or version != VERSION or slotSize <= SLOT_HEADER_SIZE:
+                    raise ValueError("%s is not a version %d ring" % (filename, VERSION))
+            finally:
+                fcntl.lockf(fd, fcntl.LOCK_UN, HEADER.size, 0)
+            self.map = mmap.mmap(fd, HEADER.size + slotSize * slotCount)
+        except Exception:
+            os.close(fd)
+            raise
+        # closing any descriptor of the file would drop our lockf() locks, so keep this one
+        self.fd = fd
+        self.slotSize = slotSize
+        self.slotCount = slotCount
+        self.capacity = slotSize - SLOT_HEADER_SIZE
+        self._pid = os.getpid()
+        self._next = self._pid % slotCount
+        self._seq = 0
+        self._lock = _process_lock(filename)
+
+    def _process_lock(self):
+        if self._pid != os.getpid():
+            # forked: the locks were replaced in the child
+            self._pid = os.getpid()
+            self._lock = _process_lock(self.filename)
+        return self._lock
+
+    def _offset(self, i):
+        return HEADER.size + i * self.slotSize
+
+    def put(self, data):
+        """
+        Copy one encoded record into a free slot. Return False when it is
+        too long for a slot or no free slot was found.
+        """
+        if len(data) > self.capacity:
+            return False
+        with self._process_lock():
+            return self._put(data)
+
+    def _put(self, data):
+        m = self.map
+        fd = self.fd
+        count = self.slotCount
+        i = self._next
+        for _ in range(min(MAX_PROBES, count)):
+            offset = HEADER.size + i * self.slotSize
+            i = i + 1 if i + 1 < count else 0
+            if m[offset:offset + 4] != b"\0\0\0\0":
+                continue
+            try:
+                fcntl.lockf(fd, fcntl.LOCK_EX | fcntl.LOCK_NB, 4, offset)
+            except (IOError, OSError):
+                continue
+            try:
+                if m[offset:offset + 4] != b"\0\0\0\0":
+                    continue
+                self._seq += 1
+                start = offset + SLOT_HEADER_SIZE
+                m[start:start + len(data)] = data
+                # the state goes last: a slot is committed once the crc matches its record
+                m[offset + 4:offset + SLOT.size] = SLOT.pack(
+                    COMMITTED, os.getpid(), time.time(), self._seq, len(data), zlib.crc32(data))[4:]
+                m[offset:offset + 4] = b"\1\0\0\0"
+            finally:
+                fcntl.lockf(fd, fcntl.LOCK_UN, 4, offset)
+            self._next = i
+            return True
+        self._next = i
+        return False
+
+    def committed(self):
+        """
+        The committed slots, oldest record first, as (key, slot, data). Call
+        with the file lock held.
+        """
+        m = self.map
+        result = []
+        for i in range(self.slotCount):
+            offset = self._offset(i)
+            if m[offset:offset + 4] == b"\0\0\0\0":
+                continue
+            state, pid, created, seq, length, crc = SLOT.unpack_from(m, offset)
+            if state != COMMITTED or length > self.capacity:
+                continue
+            data = m[offset + SLOT_HEADER_SIZE:offset + SLOT_HEADER_SIZE + length]
+            if zlib.crc32(data) != crc:
+                # still being committed; picked up by the next drain
+                continue
+            result.append(((created, pid, seq), i, data))
+        result.sort()
+        return result
+
+    def free(self, slots):
+        """Mark drained slots free again."""
+        m = self.map
+        for i in slots:
+            offset = self._offset(i)
+            # an impossible length, so that the old record is never taken for a new one
+            m[offset + 24:offset + 28] = b"\xff\xff\xff\xff"
+            m[offset:offset + 4] = b"\0\0\0\0"
+
+    def usage(self):
+        """(committed slots, slots)"""
+        m = self.map
+        used = sum(1 for i in range(self.slotCount) if m[self._offset(i):self._offset(i) + 4] != b"\0\0\0\0")
+        return used, self.slotCount
+
+    def close(self):
+        # closing the descriptor drops the lockf() locks of every RingBuffer of the file in this process
+        with self._process_lock():
+            self.map.close()
+            os.close(self.fd)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="drain or inspect the shared ring buffer of a log file")
+    sub = parser.add_subparsers(dest="command")
+    drain = sub.add_parser("drain", help="drain the ring into the log file until interrupted")
+    drain.add_argument("--config", required=True, help="JSON file with the dictConfig-style handler dict")
+    drain.add_argument("--interval", type=float, default=0.05, help="seconds between drains")
+    status = sub.add_parser("status", help="print how many slots are in use")
+    status.add_argument("filename", help="the log file")
+    args = parser.parse_args(argv)
+
+    if args.command == "status":
+        baseFilename = os.path.abspath(args.filename)
+        dirName, name = os.path.split(baseFilename[:-4] if baseFilename.endswith(".log") else baseFilename)
+        path = os.path.join(dirName, ".__" + name + ".ring")
+        if not os.path.exists(path):
+            print("%s has no ring" % args.filename)
+            return 1
+        ring = RingBuffer(path)
+        used, total = ring.usage()
+        print("%d/%d slots in use, %d bytes per slot" % (used, total, ring.slotSize))
+        ring.close()
+        return 0
+    if args.command == "drain":
+        # writer imports clog, which imports this module when a handler has ring=True
+        from .writer import build_handler
+        with open(args.config) as f:
+            spec = json.load(f)
+        spec['ring'] = True
+        handler = build_handler(spec, ringInterval=None)
+        try:
+            while True:
+                handler.drainRing()
+                time.sleep(args.interval)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            handler.close()
+        return 0
+    parser.print_help()
+    return 2
+
+
+if __name__ == "__main__":
+    sys.exit(main())
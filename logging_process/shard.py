@@ -0,0 +1,434 @@
+"""
+Per-process shards: every process writes its own file, access.<pid>.log for
+access.log, so no file lock is ever taken, and the shards are merged into
+one chronological file afterwards.
+分片写日志：每个进程写自己的access.<pid>.log，不加文件锁，之后再按时间顺序合并。
+
+    'access': {'class': 'logging_process.shard.ShardedTimedRotatingFileHandler',
+               'filename': '/data/log/example/access.log', 'when': 'h', 'mergeOnRollover': True},
+
+With when='h' every shard rolls over on the hour to access.<pid>.log.<suffix>
+(following nameFormat), and with mergeOnRollover a background thread of the
+process that rolled over merges all rotated shards of a period into
+access.log.<suffix>, the file MyTimedRotatingFileHandler would have
+written, and removes them. Shards left behind by processes that are gone
+are rotated and merged as well. The same can be run by hand or from cron::
+
+    python -m logging_process.shard merge /data/log/example/access.log --when h
+    python -m logging_process.shard merge /data/log/example/access.log --output /tmp/all.log
+    python -m logging_process.shard tail /data/log/example/access.log
+
+Merging is a heap-based k-way merge of the shards' records by timestamp
+(see reader.py for what a record and its timestamp are), streaming with
+one record per shard in memory. A crash between writing the merged file
+and removing its inputs merges them again the next time, i.e. it may
+duplicate but never loses records.
+"""
+import argparse
+import heapq
+import logging
+import os
+import re
+import sys
+import threading
+import time
+import traceback
+from logging.handlers import RotatingFileHandler, TimedRotatingFileHandler
+from operator import itemgetter
+
+from portalocker import LOCK_EX, LOCK_NB, lock, unlock
+from portalocker.exceptions import LockException
+
+from .clog import timed_backups
+from .compress import PART_SUFFIX
+from .reader import DEFAULT_NAME_FORMAT, SUFFIXES, TimeParser, iter_records
+
+# seconds per unit of when
+WHEN_SECONDS = {'S': 1, 'M': 60, 'H': 60 * 60, 'D': 24 * 60 * 60, 'MIDNIGHT': 24 * 60 * 60, 'W': 7 * 24 * 60 * 60}
+
+
+def shard_filename(filename, pid):
+    """access.log -> access.<pid>.log"""
+    stem, ext = os.path.splitext(filename)
+    return "%s.%d%s" % (stem, pid, ext)
+
+
+def shard_regex(filename):
+    """Regular expression for the base names of the shards of filename, the pid as group 'pid'."""
+    stem, ext = os.path.splitext(os.path.basename(filename))
+    return r"%s\.(?P<pid>\d+)%s" % (re.escape(stem), re.escape(ext))
+
+
+def pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def period_start(t, when, interval, utc=False, dayOfWeek=0):
+    """
+    Start of the rollover period holding t. Periods of S, M, H and D are
+    multiples of interval seconds since the epoch in local time (UTC with
+    utc), so that shards of different processes roll over together.
+    """
+    tm = time.gmtime(t) if utc else time.localtime(t)
+    if when in ('S', 'M', 'H', 'D'):
+        offset = 0 if utc else tm.tm_gmtoff
+        return t - (t + offset) % interval
+    start = int(t) - (tm.tm_hour * 3600 + tm.tm_min * 60 + tm.tm_sec)
+    if when.startswith('W'):
+        start -= ((tm.tm_wday - dayOfWeek) % 7) * 24 * 60 * 60
+    return start
+
+
+def _fill_timestamps(records):
+    # lines before the first timestamp of a shard sort first; heapq.merge() needs a number
+    last = float('-inf')
+    for ts, text in records:
+        if ts is None:
+            ts = last
+        last = ts
+        yield ts, text
+
+
+def merge_files(paths, output, parse=None, encoding="utf-8"):
+    """
+    Merge the records of paths (each in chronological order, compressed or
+    not) into output, replacing it atomically. output may be one of paths.
+    """
+    parse = parse or TimeParser()
+    streams = [_fill_timestamps(iter_records(path, parse, encoding)) for path in paths]
+    part = "%s.%d%s" % (output, os.getpid(), PART_SUFFIX)
+    try:
+        with open(part, "w", encoding=encoding) as f:
+            for _, text in heapq.merge(*streams, key=itemgetter(0)):
+                f.write(text)
+                f.write("\n")
+        os.rename(part, output)
+    except BaseException:
+        try:
+            os.remove(part)
+        except (IOError, OSError):
+            pass
+        raise
+
+
+class ShardMerger(object):
+    """
+    The shards of filename and the merged files built from them. when,
+    interval, suffix, utc and nameFormat are those of the sharded handler.
+    """
+    def __init__(self, filename, nameFormat=DEFAULT_NAME_FORMAT, when='H', interval=1, suffix=None, utc=False,
+                 dayOfWeek=0, timePattern=None, timeFormat=None, encoding="utf-8"):
+        self.filename = os.path.abspath(filename)
+        self.nameFormat = nameFormat
+        self.when = when.upper()
+        key = 'W' if self.when.startswith('W') else self.when
+        self.interval = WHEN_SECONDS[key] * interval
+        self.suffix = suffix or SUFFIXES[key]
+        self.utc = utc
+        self.dayOfWeek = dayOfWeek
+        self.parse = TimeParser(timePattern, timeFormat)
+        self.encoding = encoding
+        stem = self.filename[:-4] if self.filename.endswith(".log") else self.filename
+        lock_path, lock_name = os.path.split(stem + ".merge.lock")
+        self.lockFilename = os.path.join(lock_path, ".__" + lock_name)
+
+    def live_shards(self):
+        """(pid, path) of the shards being written, or left behind by a dead process."""
+        dirName = os.path.dirname(self.filename)
+        pattern = re.compile("^%s$" % shard_regex(self.filename))
+        result = []
+        for fileName in os.listdir(dirName):
+            m = pattern.match(fileName)
+            if m:
+                result.append((int(m.group('pid')), os.path.join(dirName, fileName)))
+        return sorted(result)
+
+    def rotated_shards(self):
+        """{start of period: [paths]} of the rotated shards."""
+        groups = {}
+        for start, path in timed_backups(self.filename, self.nameFormat, self.suffix, shard_regex(self.filename)):
+            groups.setdefault(start, []).append(path)
+        return groups
+
+    def backup_name(self, filename, start):
+        basePath, name = os.path.split(filename)
+        suffix = time.strftime(self.suffix, time.gmtime(start) if self.utc else time.localtime(start))
+        return self.nameFormat.format(basePath=basePath, filename=name, suffix=suffix)
+
+    def seal_dead(self):
+        """
+        Rotate the live shards of processes that are gone, as their handler
+        would have at its next rollover, so that they get merged.
+        """
+        for pid, path in self.live_shards():
+            if pid == os.getpid() or pid_alive(pid):
+                continue
+            try:
+                st = os.stat(path)
+                if st.st_size == 0:
+                    os.remove(path)
+                    continue
+                # a shard only holds records of one period, the one of its last write
+                start = period_start(st.st_mtime, self.when, self.interval, self.utc, self.dayOfWeek)
+                dest = self.backup_name(path, start)
+                if os.path.exists(dest):
+                    merge_files([dest, path], dest, self.parse, self.encoding)
+                    os.remove(path)
+                else:
+                    os.rename(path, dest)
+            except (IOError, OSError):
+                continue
+
+    def merge(self, block=True):
+        """
+        Merge every rotated shard into the merged file of its period (merging
+        again with what is already there) and remove it. Return the merged
+        files, or None if another process is merging and block is false.
+        """
+        with open(self.lockFilename, "wb", buffering=0) as stream_lock:
+            try:
+                lock(stream_lock, LOCK_EX if block else LOCK_EX | LOCK_NB)
+            except LockException:
+                return None
+            try:
+                self.seal_dead()
+                merged = []
+                for start, paths in sorted(self.rotated_shards().items()):
+                    target = self.backup_name(self.filename, start)
+                    inputs = sorted(paths) + ([target] if os.path.exists(target) else [])
+                    merge_files(inputs, target, self.parse, self.encoding)
+                    for path in paths:
+                        os.remove(path)
+                    merged.append(target)
+                return merged
+            finally:
+                unlock(stream_lock)
+
+    def all_shards(self):
+        """Every shard file, live, rotated by time or by size."""
+        dirName = os.path.dirname(self.filename)
+        pattern = re.compile(r"^%s(?:\..+)?$" % shard_regex(self.filename))
+        return sorted(os.path.join(dirName, name) for name in os.listdir(dirName)
+                      if pattern.match(name) and not name.endswith(PART_SUFFIX))
+
+    def merge_all(self, output):
+        """Merge every shard, including the live ones, into output without removing anything."""
+        merge_files(self.all_shards(), output, self.parse, self.encoding)
+
+    def follow(self, lag=1.0, pollInterval=0.25, fromStart=False):
+        """
+        Generate the records written to the live shards from now on (with
+        fromStart, from their beginning) in timestamp order: a record is held
+        back until it is lag seconds old, so that records of other shards with
+        an earlier timestamp can still come before it. Records arriving more
+        than lag seconds late are output as they come. Runs until closed.
+        """
+        files = {}
+        heap = []
+        counter = 0
+        first_scan = True
+        while True:
+            now = time.time()
+            live = set(path for _, path in self.live_shards())
+            for path in live - set(files):
+                try:
+                    f = open(path, "rb")
+                except (IOError, OSError):
+                    continue
+                if first_scan and not fromStart:
+                    f.seek(0, os.SEEK_END)
+                files[path] = [f, b"", None]
+            first_scan = False
+            for path, state in list(files.items()):
+                f, buf, pending = state
+                buf += f.read()
+                lines = buf.split(b"\n")
+                buf = lines.pop()
+                for line in lines:
+                    ts = self.parse(line)
+                    if ts is not None or pending is None:
+                        if pending is not None:
+                            heapq.heappush(heap, (pending[0], counter, pending[1]))
+                            counter += 1
+                        pending = (now if ts is None else ts, [line])
+                    else:
+                        pending[1].append(line)
+                # the last record of a shard is complete once nothing followed it for lag seconds
+                if pending is not None and not lines and pending[0] <= now - lag:
+                    heapq.heappush(heap, (pending[0], counter, pending[1]))
+                    counter += 1
+                    pending = None
+                state[1], state[2] = buf, pending
+                try:
+                    current = os.stat(path).st_ino == os.fstat(f.fileno()).st_ino
+                except OSError:
+                    current = False
+                if not current:
+                    # rotated or merged away: what was left has been read, the new file is read from its start
+                    if pending is not None:
+                        heapq.heappush(heap, (pending[0], counter, pending[1]))
+                        counter += 1
+                    f.close()
+                    del files[path]
+            while heap and heap[0][0] <= now - lag:
+                _, _, lines = heapq.heappop(heap)
+                yield b"\n".join(lines).decode(self.encoding, "replace")
+            time.sleep(pollInterval)
+
+
+def _merge_quietly(merger):
+    # noinspection PyBroadException
+    try:
+        merger.merge(block=False)
+    except Exception:
+        if logging.raiseExceptions:
+            traceback.print_exc(file=sys.stderr)
+
+
+class _ShardMixin(object):
+    """Keeps the handler on the shard of the current process, also after fork()."""
+    def _init_shard(self, filename):
+        self.shardFilename = os.path.abspath(filename)
+        self._shard_pid = os.getpid()
+        return shard_filename(self.shardFilename, self._shard_pid)
+
+    def _check_pid(self):
+        if self._shard_pid != os.getpid():
+            # The stream is the parent's shard; records are flushed one by one, so nothing is pending in it.
+            if self.stream is not None:
+                self.stream.close()
+                self.stream = None
+            self._shard_pid = os.getpid()
+            self.baseFilename = shard_filename(self.shardFilename, self._shard_pid)
+
+
+class ShardedTimedRotatingFileHandler(_ShardMixin, TimedRotatingFileHandler):
+    """
+    TimedRotatingFileHandler writing the shard of the current process,
+    without any file lock. Rollover periods of S, M, H and D are aligned to
+    the clock (see period_start()) so that all shards roll over together, and
+    rotated shards are named by nameFormat as in MyTimedRotatingFileHandler.
+    With mergeOnRollover the rotated shards are merged in a background
+    thread after each rollover, see ShardMerger.merge().
+    """
+    def __init__(self, filename, when='h', interval=1, backupCount=0, encoding=None, delay=False, utc=False,
+                 atTime=None, nameFormat=DEFAULT_NAME_FORMAT, mergeOnRollover=False):
+        self.nameFormat = nameFormat
+        self.mergeOnRollover = mergeOnRollover
+        self._merge_thread = None
+        shard = self._init_shard(filename)
+        TimedRotatingFileHandler.__init__(self, shard, when, interval, backupCount, encoding, delay, utc, atTime)
+        self.namer = self._backup_name
+
+    def computeRollover(self, currentTime):
+        if self.when in ('S', 'M', 'H', 'D'):
+            return period_start(currentTime, self.when, self.interval, self.utc) + self.interval
+        return TimedRotatingFileHandler.computeRollover(self, currentTime)
+
+    def shouldRollover(self, record):
+        # Pure clock comparison: no file is stat()ed per record.
+        return time.time() >= self.rolloverAt
+
+    def _backup_name(self, default_name):
+        basePath, filename = os.path.split(self.baseFilename)
+        suffix = default_name[len(self.baseFilename) + 1:]
+        return self.nameFormat.format(basePath=basePath, filename=filename, suffix=suffix)
+
+    def getFilesToDelete(self):
+        result = sorted(timed_backups(self.baseFilename, self.nameFormat, self.suffix))
+        if len(result) <= self.backupCount:
+            return []
+        return [path for _, path in result[:len(result) - self.backupCount]]
+
+    def merger(self):
+        when = 'W' if self.when.startswith('W') else self.when
+        return ShardMerger(self.shardFilename, self.nameFormat, self.when, self.interval // WHEN_SECONDS[when],
+                           self.suffix, self.utc, getattr(self, 'dayOfWeek', 0))
+
+    def doRollover(self):
+        TimedRotatingFileHandler.doRollover(self)
+        if self.mergeOnRollover and (self._merge_thread is None or not self._merge_thread.is_alive()):
+            self._merge_thread = threading.Thread(target=_merge_quietly, args=(self.merger(),),
+                                                  name="logging_process-merge")
+            self._merge_thread.daemon = True
+            self._merge_thread.start()
+
+    def emit(self, record):
+        self._check_pid()
+        TimedRotatingFileHandler.emit(self, record)
+
+    def close(self):
+        thread = self._merge_thread
+        if thread is not None and thread.is_alive() and self._shard_pid == os.getpid():
+            thread.join()
+        TimedRotatingFileHandler.close(self)
+
+
+class ShardedRotatingFileHandler(_ShardMixin, RotatingFileHandler):
+    """
+    RotatingFileHandler writing the shard of the current process, without
+    any file lock: access.<pid>.log rolls over to access.<pid>.log.1 ... .N
+    at maxBytes. As in MyRotatingFileHandler the current record is not
+    counted, so a file may exceed maxBytes by one record. Merge the shards on
+    demand with ShardMerger.merge_all().
+    """
+    def __init__(self, filename, mode='a', maxBytes=0, backupCount=0, encoding=None, delay=False):
+        shard = self._init_shard(filename)
+        RotatingFileHandler.__init__(self, shard, mode, maxBytes, backupCount, encoding, delay)
+
+    def shouldRollover(self, record):
+        if self.maxBytes <= 0:
+            return False
+        if self.stream is None:
+            self.stream = self._open()
+        return self.stream.tell() >= self.maxBytes
+
+    def emit(self, record):
+        self._check_pid()
+        RotatingFileHandler.emit(self, record)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="merge or follow the per-process shards of a log file")
+    parser.add_argument("command", choices=("merge", "tail", "list"))
+    parser.add_argument("filename", help="the log file, as configured in the sharded handler")
+    parser.add_argument("--when", default="H", help="when of the handler")
+    parser.add_argument("--interval", type=int, default=1, help="interval of the handler")
+    parser.add_argument("--utc", action="store_true", help="utc of the handler")
+    parser.add_argument("--suffix", help="strftime suffix of the backups, by default the one of --when")
+    parser.add_argument("--name-format", default=DEFAULT_NAME_FORMAT, help="nameFormat of the handler")
+    parser.add_argument("--output", help="merge: merge every shard, live ones included, into this file instead")
+    parser.add_argument("--lag", type=float, default=1.0, help="tail: seconds a record is held back for ordering")
+    parser.add_argument("--from-start", action="store_true", help="tail: start at the beginning of the shards")
+    args = parser.parse_args(argv)
+
+    merger = ShardMerger(args.filename, args.name_format, args.when, args.interval, args.suffix, args.utc)
+    if args.command == "list":
+        for pid, path in merger.live_shards():
+            print("%s\t%d\t%s" % (path, pid, "alive" if pid_alive(pid) else "dead"))
+        for start, paths in sorted(merger.rotated_shards().items()):
+            for path in sorted(paths):
+                print("%s\t-\trotated" % path)
+    elif args.command == "merge":
+        if args.output:
+            merger.merge_all(args.output)
+        else:
+            for path in merger.merge():
+                print(path)
+    else:
+        try:
+            for record in merger.follow(args.lag, fromStart=args.from_start):
+                sys.stdout.write(record + "\n")
+                sys.stdout.flush()
+        except (KeyboardInterrupt, BrokenPipeError):
+            pass
+
+
+if __name__ == "__main__":
+    main()
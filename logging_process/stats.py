@@ -0,0 +1,117 @@
+"""
+Optional instrumentation of the hot path of the file handlers.
+日志写入路径的统计：等锁、持锁、写入、切分、落盘的耗时及次数。
+
+Enabled per handler with collectStats=True; handler.stats() then returns a
+snapshot such as::
+
+    {'records': 1200, 'bytes': 120000, 'rollovers': 3, 'lockRetries': 0, 'lockFailures': 0,
+     'errors': 0, 'fsyncs': 12,
+     'lockWait': {'count': 1200, 'total': 0.21, 'max': 0.012, 'p50': 8e-06, 'p99': 0.004096, ...},
+     'lockHold': {...}, 'write': {...}, 'rollover': {...}, 'fsync': {...}}
+
+Timings are in seconds and kept in histograms of power of two microsecond
+buckets, so percentiles are upper bounds within a factor of two.
+"""
+import json
+import os
+import time
+
+# bucket i holds durations below 2**i microseconds, the last one everything longer
+BUCKETS = 32
+
+
+class Histogram(object):
+    __slots__ = ('count', 'total', 'max', 'buckets')
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.buckets = [0] * BUCKETS
+
+    def add(self, seconds):
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+        self.buckets[min(int(seconds * 1e6).bit_length(), BUCKETS - 1)] += 1
+
+    def percentile(self, p):
+        """Upper bound of the bucket holding the p-th percentile, in seconds."""
+        if not self.count:
+            return 0.0
+        rank = p / 100.0 * self.count
+        seen = 0
+        for i, n in enumerate(self.buckets):
+            seen += n
+            if n and seen >= rank:
+                return min((1 << i) / 1e6, self.max)
+        return self.max
+
+    def snapshot(self):
+        return {
+            'count': self.count,
+            'total': self.total,
+            'max': self.max,
+            'mean': self.total / self.count if self.count else 0.0,
+            'p50': self.percentile(50),
+            'p99': self.percentile(99),
+            'p999': self.percentile(99.9),
+        }
+
+
+class HandlerStats(object):
+    """
+    Counters and histograms of one handler in one process. The handler
+    updates them while holding its own lock, so they need no locking here.
+    """
+    COUNTERS = ('records', 'bytes', 'rollovers', 'lockRetries', 'lockFailures', 'errors', 'fsyncs')
+    HISTOGRAMS = ('lockWait', 'lockHold', 'write', 'rollover', 'fsync')
+
+    def __init__(self, interval=None, filename=None):
+        self.interval = interval
+        self.filename = filename
+        self.reset()
+        self._dump_at = time.time() + interval if interval else None
+
+    def reset(self):
+        self.records = 0
+        self.bytes = 0
+        self.rollovers = 0
+        self.lockRetries = 0
+        self.lockFailures = 0
+        self.errors = 0
+        self.fsyncs = 0
+        self.lockWait = Histogram()
+        self.lockHold = Histogram()
+        self.write = Histogram()
+        self.rollover = Histogram()
+        self.fsync = Histogram()
+
+    def snapshot(self):
+        result = dict((name, getattr(self, name)) for name in self.COUNTERS)
+        for name in self.HISTOGRAMS:
+            result[name] = getattr(self, name).snapshot()
+        return result
+
+    def maybe_dump(self, handlerName):
+        """Append a snapshot to filename once every interval seconds."""
+        if self._dump_at is not None and time.time() >= self._dump_at:
+            self._dump_at = time.time() + self.interval
+            self.dump(handlerName)
+
+    def dump(self, handlerName):
+        """Append one JSON line with the snapshot, the handler file and our pid."""
+        if not self.filename:
+            return
+        line = dict(self.snapshot(), time=time.time(), pid=os.getpid(), handler=handlerName)
+        data = (json.dumps(line, sort_keys=True) + "\n").encode("utf-8")
+        try:
+            fd = os.open(self.filename, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o666)
+            try:
+                os.write(fd, data)
+            finally:
+                os.close(fd)
+        except (IOError, OSError):
+            pass
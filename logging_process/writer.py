@@ -0,0 +1,261 @@
+"""
+Central writer process mode.
+
+Worker processes format their records and put them on a multiprocessing
+queue; one dedicated writer process owns the MyRotatingFileHandler /
+MyTimedRotatingFileHandler instances and writes the records in batches, so
+no worker ever waits on the file lock.
+单独的写日志进程：工作进程只负责格式化并放入队列，由写进程批量写入文件。
+
+    writer = start_log_writer({
+        'common': {'class': 'logging_process.MyTimedRotatingFileHandler',
+                   'filename': '/data/log/example/access.log', 'when': 'd', 'backupCount': 60},
+    })
+
+and in the dictConfig of the workers::
+
+    'common': {'class': 'logging_process.QueueProducerHandler',
+               'writer': 'ext://myproject.logconf.writer', 'target': 'common',
+               'formatter': 'simple', 'level': 'INFO'},
+
+Behaviour at the edges:
+
+* queue full: the record is dropped and counted in ``handler.dropped``
+  (or, with block=True, the worker waits up to ``timeout`` first).
+* writer death: producers notice within ``checkInterval`` seconds and fall
+  back to writing through a locally built copy of the target handler, i.e.
+  the normal locked path. Records still in the queue when the writer died
+  are lost.
+* shutdown: ``writer.stop()`` (registered with atexit in the creating
+  process) drains whatever is queued, closes the handlers and joins the
+  writer. Records put by a worker are flushed to the queue by its feeder
+  thread when the worker exits.
+"""
+import atexit
+import importlib
+import logging
+import multiprocessing
+import os
+import signal
+import sys
+import time
+import traceback
+
+from .clog import ConcurrentLock
+
+try:
+    from queue import Empty, Full
+except ImportError:  # pragma: no cover
+    from Queue import Empty, Full
+
+_STOP = None
+
+
+def resolve_class(cls):
+    if isinstance(cls, str):
+        module, _, name = cls.rpartition('.')
+        cls = getattr(importlib.import_module(module), name)
+    return cls
+
+
+def build_handler(spec, **defaults):
+    """
+    Create a handler from a dictConfig-style dict: 'class' plus its keyword
+    arguments. 'level' is applied; 'formatter' is ignored because records
+    arrive already formatted. Keyword arguments in defaults are only used for
+    handlers of this package and only when the spec does not set them.
+    """
+    spec = dict(spec)
+    cls = resolve_class(spec.pop('class'))
+    level = spec.pop('level', None)
+    spec.pop('formatter', None)
+    if issubclass(cls, ConcurrentLock):
+        for key, value in defaults.items():
+            spec.setdefault(key, value)
+    handler = cls(**spec)
+    if level is not None:
+        handler.setLevel(level)
+    return handler
+
+
+def write_batch(handler, msgs, levelno=None):
+    """
+    Write already formatted messages to a handler of this package in one go.
+    levelno is the highest level among them, for the handler's fsyncLevel.
+    """
+    # noinspection PyBroadException
+    try:
+        handler.acquire()
+        try:
+            handler._write_record(handler.terminator.join(msgs), levelno, len(msgs))
+        finally:
+            handler.release()
+    except Exception:
+        if logging.raiseExceptions:
+            traceback.print_exc(file=sys.stderr)
+
+
+def _writer_main(queue, handlers, batchSize, flushInterval):
+    # Ctrl-C in the parent must not kill the writer before it has drained the queue.
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    targets = dict((name, build_handler(spec, keepOpen=True)) for name, spec in handlers.items())
+    stopping = False
+    try:
+        while True:
+            try:
+                item = queue.get(timeout=flushInterval)
+            except Empty:
+                if stopping:
+                    break
+                continue
+            batch = {}
+            count = 0
+            while True:
+                if item is _STOP:
+                    stopping = True
+                else:
+                    name, levelno, msg = item
+                    handler = targets.get(name)
+                    if handler is not None and levelno >= handler.level:
+                        entry = batch.setdefault(name, [levelno, []])
+                        entry[0] = max(entry[0], levelno)
+                        entry[1].append(msg)
+                count += 1
+                if count >= batchSize:
+                    break
+                try:
+                    item = queue.get_nowait()
+                except Empty:
+                    break
+            for name, (levelno, msgs) in batch.items():
+                write_batch(targets[name], msgs, levelno)
+    finally:
+        for handler in targets.values():
+            handler.close()
+
+
+class LogWriter(object):
+    """
+    Handle on the writer process. Pass it (or make it reachable through
+    ext://) to the QueueProducerHandler of every worker.
+    """
+    def __init__(self, handlers, maxsize=10000, batchSize=500, flushInterval=0.5, context=None):
+        ctx = multiprocessing.get_context(context) if context else multiprocessing
+        self.handlers = handlers
+        self.queue = ctx.Queue(maxsize)
+        self.process = ctx.Process(target=_writer_main, args=(self.queue, handlers, batchSize, flushInterval),
+                                   name="logging_process-writer")
+        self.pid = None
+        self._owner = os.getpid()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['process'] = None
+        return state
+
+    def start(self):
+        self.process.start()
+        self.pid = self.process.pid
+        atexit.register(self.stop)
+        return self
+
+    def is_alive(self):
+        if self.pid is None:
+            return False
+        if self._owner == os.getpid() and self.process is not None:
+            # The parent must reap the writer, kill(pid, 0) succeeds on a zombie.
+            return self.process.is_alive()
+        if os.name != 'posix':
+            return True
+        try:
+            os.kill(self.pid, 0)
+        except OSError:
+            return False
+        return True
+
+    def stop(self, timeout=10.0):
+        """Ask the writer to drain the queue and exit, then wait for it."""
+        if self._owner != os.getpid() or self.process is None:
+            return
+        if not self.process.is_alive():
+            self.queue.cancel_join_thread()
+            return
+        try:
+            self.queue.put(_STOP, timeout=timeout)
+        except Full:
+            pass
+        self.process.join(timeout)
+
+
+def start_log_writer(handlers, maxsize=10000, batchSize=500, flushInterval=0.5, context=None):
+    """
+    Start the writer process for handlers, a dict of target name to a
+    dictConfig-style handler dict, and return its LogWriter.
+    """
+    return LogWriter(handlers, maxsize, batchSize, flushInterval, context).start()
+
+
+class QueueProducerHandler(logging.Handler):
+    """
+    Handler used in the workers: formats the record and puts it on the
+    writer's queue for the target handler.
+    """
+    def __init__(self, writer, target, block=False, timeout=None, fallback=True, checkInterval=1.0):
+        logging.Handler.__init__(self)
+        self.writer = writer
+        self.target = target
+        self.block = block
+        self.timeout = timeout
+        self.fallback = fallback
+        self.checkInterval = checkInterval
+        self.dropped = 0
+        self._fallback_handler = None
+        self._writer_alive = True
+        self._checked_at = 0
+
+    def _check_writer(self):
+        now = time.time()
+        if now - self._checked_at >= self.checkInterval:
+            self._checked_at = now
+            self._writer_alive = self.writer.is_alive()
+            if not self._writer_alive:
+                # Nobody reads the queue any more, don't block the exit of this process on it.
+                self.writer.queue.cancel_join_thread()
+        return self._writer_alive
+
+    def _write_fallback(self, msg, levelno):
+        if self._fallback_handler is None:
+            self._fallback_handler = build_handler(self.writer.handlers[self.target])
+        write_batch(self._fallback_handler, [msg], levelno)
+
+    def emit(self, record):
+        # noinspection PyBroadException
+        try:
+            msg = self.format(record)
+            if not self._check_writer():
+                if self.fallback:
+                    self._write_fallback(msg, record.levelno)
+                else:
+                    self.dropped += 1
+                return
+            try:
+                if self.block:
+                    self.writer.queue.put((self.target, record.levelno, msg), True, self.timeout)
+                else:
+                    self.writer.queue.put_nowait((self.target, record.levelno, msg))
+            except Full:
+                self.dropped += 1
+        except (KeyboardInterrupt, SystemExit):
+            raise
+        except Exception:
+            self.handleError(record)
+
+    def close(self):
+        self.acquire()
+        try:
+            if self._fallback_handler is not None:
+                self._fallback_handler.close()
+                self._fallback_handler = None
+        finally:
+            self.release()
+        logging.Handler.close(self)
@@ -22,4 +22,13 @@ setup(
     install_requires=[
         'portalocker>=2.3.0'
     ],
+    entry_points={
+        'console_scripts': [
+            'logging-process-aggregator=logging_process.aggregator:main',
+            'logging-process-benchmark=logging_process.benchmark:main',
+            'logging-process-reader=logging_process.reader:main',
+            'logging-process-ring=logging_process.ring:main',
+            'logging-process-shard=logging_process.shard:main',
+        ],
+    },
 )
\ No newline at end of file
@@ -0,0 +1,20 @@
+import logging
+
+from logging_process import clog
+
+
+def make_record(levelno, msg):
+    return logging.LogRecord("test", levelno, __file__, 1, msg, None, None)
+
+
+def test_no_flush_interval(tmp_path):
+    path = tmp_path / 'app.log'
+    handler = clog.MyBufferedRotatingFileHandler(str(path), flushCount=2, flushInterval=None)
+    try:
+        handler.emit(make_record(logging.INFO, "one"))
+        assert handler._buffer == ["one"]
+        handler.emit(make_record(logging.INFO, "two"))
+        assert not handler._buffer
+        assert path.read_text() == "one\ntwo\n"
+    finally:
+        handler.close()
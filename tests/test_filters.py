@@ -0,0 +1,35 @@
+import logging
+
+from logging_process import BurstFilter
+
+
+class ListHandler(logging.Handler):
+    def __init__(self):
+        logging.Handler.__init__(self)
+        self.records = []
+
+    def emit(self, record):
+        self.records.append(record)
+
+
+def test_filter_shared_by_two_handlers():
+    logger = logging.getLogger("test_filters.shared")
+    logger.propagate = False
+    burst = BurstFilter(burst=3, window=60)
+    handlers = [ListHandler(), ListHandler()]
+    for handler in handlers:
+        handler.addFilter(burst)
+        logger.addHandler(handler)
+    try:
+        for i in range(8):
+            logger.warning("disk full %d", i)
+        assert burst.suppressed == 5
+        for handler in handlers:
+            assert [r.getMessage() for r in handler.records] == ["disk full 0", "disk full 1", "disk full 2"]
+        burst.flush()
+        for handler in handlers:
+            assert len(handler.records) == 4
+            assert handler.records[-1].suppressed == 5
+    finally:
+        for handler in handlers:
+            logger.removeHandler(handler)
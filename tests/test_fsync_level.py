@@ -0,0 +1,114 @@
+"""
+fsyncLevel must also apply to records written in batches: the batch is
+synced when any of its records is at or above fsyncLevel, whichever record
+came last.
+"""
+import logging
+import queue
+import socket
+
+import pytest
+
+from logging_process import clog, writer
+from logging_process.aggregator import LogAggregator, encode_frame
+from logging_process.background import BackgroundHandler
+
+
+@pytest.fixture
+def syncs(monkeypatch):
+    calls = []
+    monkeypatch.setattr(clog, '_fdatasync', calls.append)
+    return calls
+
+
+def make_record(levelno, msg):
+    return logging.LogRecord("test", levelno, __file__, 1, msg, None, None)
+
+
+def spec(tmp_path):
+    return {'class': 'logging_process.MyRotatingFileHandler', 'filename': str(tmp_path / 'app.log'),
+            'fsyncLevel': 'WARNING'}
+
+
+def test_buffered_handler(tmp_path, syncs):
+    handler = clog.MyBufferedRotatingFileHandler(str(tmp_path / 'app.log'), fsyncLevel='WARNING',
+                                                 flushCount=3, flushInterval=60, flushLevel=logging.CRITICAL)
+    try:
+        handler.emit(make_record(logging.WARNING, "warning"))
+        handler.emit(make_record(logging.INFO, "info"))
+        assert not syncs
+        handler.emit(make_record(logging.INFO, "info"))
+        assert len(syncs) == 1
+        for _ in range(3):
+            handler.emit(make_record(logging.INFO, "info"))
+        assert len(syncs) == 1
+    finally:
+        handler.close()
+
+
+def test_background_handler(tmp_path, syncs):
+    handler = BackgroundHandler(spec(tmp_path))
+    try:
+        handler.emit(make_record(logging.INFO, "info"))
+        handler.flush()
+        assert not syncs
+        handler.emit(make_record(logging.WARNING, "warning"))
+        handler.emit(make_record(logging.INFO, "info"))
+        handler.flush()
+        assert syncs
+    finally:
+        handler.close()
+
+
+class BatchQueue(object):
+    """Hands out one batch per get(), then the stop marker."""
+    def __init__(self, batch, syncs):
+        self.items = list(batch)
+        self.syncs = syncs
+        self.synced = None
+
+    def get(self, timeout=None):
+        if self.items:
+            return self.items.pop(0)
+        if self.synced is None:
+            # the batch is written, the handlers are not closed yet
+            self.synced = len(self.syncs)
+            return writer._STOP
+        raise queue.Empty
+
+    def get_nowait(self):
+        if self.items:
+            return self.items.pop(0)
+        raise queue.Empty
+
+
+def test_writer_process(tmp_path, syncs, monkeypatch):
+    # run the writer loop in this process
+    monkeypatch.setattr(writer.signal, 'signal', lambda *args: None)
+    q = BatchQueue([('app', logging.WARNING, "warning"), ('app', logging.INFO, "info")], syncs)
+    writer._writer_main(q, {'app': spec(tmp_path)}, 500, 0.01)
+    assert q.synced == 1
+    with open(str(tmp_path / 'app.log')) as f:
+        assert f.read() == "warning\ninfo\n"
+
+
+def test_aggregator(tmp_path, syncs):
+    aggregator = LogAggregator(str(tmp_path / 'agg.sock'), {'app': spec(tmp_path)})
+    client, conn = socket.socketpair()
+    try:
+        aggregator._buffers[conn] = bytearray()
+        client.sendall(encode_frame('app', "info", logging.INFO))
+        batch = {}
+        aggregator._read(conn, batch)
+        aggregator._write(batch)
+        assert not syncs
+        client.sendall(encode_frame('app', "warning", logging.WARNING) + encode_frame('app', "info", logging.INFO))
+        batch = {}
+        aggregator._read(conn, batch)
+        aggregator._write(batch)
+        assert syncs
+    finally:
+        client.close()
+        conn.close()
+        for handler in aggregator.handlers.values():
+            handler.close()
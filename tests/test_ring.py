@@ -0,0 +1,40 @@
+import logging
+import os
+
+import pytest
+
+from logging_process import clog
+
+pytestmark = pytest.mark.skipif(os.name != 'posix', reason="the ring buffer is POSIX only")
+
+
+def make_record(msg):
+    return logging.LogRecord("test", logging.INFO, __file__, 1, msg, None, None)
+
+
+def read(path):
+    with open(path) as f:
+        return f.read()
+
+
+def test_new_handler_drains_left_records(tmp_path):
+    path = str(tmp_path / 'app.log')
+    crashed = clog.MyRotatingFileHandler(path, maxBytes=1 << 20, backupCount=1, ring=True,
+                                         ringDrainCount=1000, ringInterval=0)
+    crashed.emit(make_record("one"))
+    crashed.emit(make_record("two"))
+    assert not os.path.exists(path) or read(path) == ""
+    handler = clog.MyRotatingFileHandler(path, maxBytes=1 << 20, backupCount=1, ring=True)
+    try:
+        assert read(path) == "one\ntwo\n"
+    finally:
+        handler.close()
+        crashed._ring.close()
+
+
+def test_close_drains(tmp_path):
+    path = str(tmp_path / 'app.log')
+    handler = clog.MyTimedRotatingFileHandler(path, when='d', ring=True, ringDrainCount=1000, ringInterval=0)
+    handler.emit(make_record("one"))
+    handler.close()
+    assert read(path) == "one\n"
@@ -0,0 +1,67 @@
+import glob
+import logging
+import os
+import time
+
+from logging_process import clog
+
+
+def make_record(msg):
+    return logging.LogRecord("test", logging.INFO, __file__, 1, msg, None, None)
+
+
+def read(path):
+    with open(path) as f:
+        return f.read()
+
+
+def test_size_rollover_without_plan_keeps_records(tmp_path, monkeypatch):
+    path = str(tmp_path / 'app.log')
+    handler = clog.MyRotatingFileHandler(path, maxBytes=10, backupCount=1)
+    try:
+        handler.emit(make_record("first record"))
+        handler.emit(make_record("second record"))
+        assert read(path + ".1") == "first record\n"
+        monkeypatch.setattr(handler, '_shift_plan', lambda expired: None)
+        handler.emit(make_record("third record"))
+        # the expired .1 is kept and the records stay in the live file
+        assert read(path + ".1") == "first record\n"
+        assert read(path) == "second record\nthird record\n"
+        assert not glob.glob(path + ".rotate.*")
+    finally:
+        handler.close()
+
+
+def test_restore_appends_to_recreated_file(tmp_path):
+    path = str(tmp_path / 'app.log')
+    handler = clog.MyRotatingFileHandler(path, maxBytes=10, backupCount=1)
+    try:
+        tmpname = path + ".rotate.00000001"
+        with open(tmpname, "w") as f:
+            f.write("old\n")
+        with open(path, "w") as f:
+            f.write("new\n")
+        handler._restore_live(tmpname)
+        assert read(path) == "new\nold\n"
+        assert not os.path.exists(tmpname)
+    finally:
+        handler.close()
+
+
+def test_timed_rollover_keeps_uncatalogued_backup(tmp_path):
+    path = str(tmp_path / 'app.log')
+    handler = clog.MyTimedRotatingFileHandler(path, when='s', interval=60)
+    try:
+        handler.emit(make_record("current"))
+        handler.rolloverAt = int(time.time())
+        handler._write_rollover_state(handler.rolloverAt)
+        dfn = "%s.%s" % (path, time.strftime(handler.suffix, time.localtime(handler.rolloverAt - handler.interval)))
+        # a backup the catalog does not know about
+        handler.catalog.load()
+        with open(dfn, "w") as f:
+            f.write("backup\n")
+        handler.doRollover()
+        assert read(dfn) == "backup\n"
+        assert read(path) == "current\n"
+    finally:
+        handler.close()
@@ -0,0 +1,39 @@
+import logging
+import os
+
+from logging_process import clog
+
+
+def make_record(msg):
+    return logging.LogRecord("test", logging.INFO, __file__, 1, msg, None, None)
+
+
+def test_notices_removed_file(tmp_path):
+    path = tmp_path / 'app.log'
+    handler = clog.MyTimedRotatingFileHandler(str(path), when='d', keepOpen=True)
+    try:
+        handler.emit(make_record("before"))
+        os.remove(str(path))
+        for i in range(handler.statInterval):
+            handler.emit(make_record("after %d" % i))
+        assert path.exists()
+        assert path.read_text().endswith("after %d\n" % (handler.statInterval - 1))
+    finally:
+        handler.close()
+
+
+def test_checks_every_record_without_shared_state(tmp_path, monkeypatch):
+    def timeout(self):
+        raise clog.LockTimeout("locked")
+    monkeypatch.setattr(clog.MyTimedRotatingFileHandler, '_do_lock', timeout)
+    handler = clog.MyTimedRotatingFileHandler(str(tmp_path / 'app.log'), when='d', keepOpen=True)
+    monkeypatch.undo()
+    try:
+        assert handler.statInterval == 1
+        handler.emit(make_record("before"))
+        os.remove(handler.baseFilename)
+        handler.emit(make_record("after"))
+        with open(handler.baseFilename) as f:
+            assert f.read() == "after\n"
+    finally:
+        handler.close()